@@ -53,16 +53,45 @@ def create_app():
     app.register_blueprint(memes_bp)
     app.register_blueprint(config_bp)
 
+    # Start the background render and pre-render workers with the first request, so the
+    # debug reloader's watcher process never runs them. Worker processes are forked first,
+    # while those threads don't exist yet
+    @app.before_request
+    def ensure_render_worker():
+        from services.process_pool import start_process_pool
+        from services.render_jobs import start_render_worker
+        from services.prerender import start_prerender_worker
+        start_process_pool()
+        start_render_worker(app)
+        start_prerender_worker(app)
+
+    # Let audio players load the compact preview of a generated WAV when there is one
+    @app.template_filter('audio_preview')
+    def audio_preview_filter(audio_path):
+        from services.helpers import audio_preview_path
+        preview_path = audio_preview_path(audio_path)
+        return preview_path if os.path.exists(preview_path) else None
+
     # Add health check endpoint
     @app.route('/health')
     def health_check():
-        """Health check endpoint"""
-        return jsonify({'status': 'healthy', 'app': 'Automatic Meme Content Generator'})
+        """Health check endpoint, including the detected FFmpeg capabilities"""
+        from services.ffmpeg_caps import capabilities_summary
+        ffmpeg = capabilities_summary()
+        status = 'healthy' if ffmpeg['available'] and not ffmpeg['missing'] else 'degraded'
+        return jsonify({'status': status, 'app': 'Automatic Meme Content Generator', 'ffmpeg': ffmpeg})
 
     # Create database tables
     with app.app_context():
-        from models import db
+        from models import db, upgrade_schema
+        from services.helpers import backfill_media_durations
         db.create_all()
+        upgrade_schema()
+        backfill_media_durations()
+
+    # Probe FFmpeg once so renders can pick working command variants up front
+    from services.ffmpeg_caps import get_ffmpeg_capabilities
+    get_ffmpeg_capabilities()
 
     return app
 
@@ -0,0 +1,112 @@
+"""
+Benchmark the pooled image downloader against serial one-off requests, using a local
+stand-in image server with artificial latency
+
+Usage: python benchmarks/bench_downloads.py [image_count] [latency_ms]
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.downloader import Downloader
+
+IMAGE_BYTES = os.urandom(200 * 1024)
+
+def make_handler(latency):
+    class ImageHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like a real image host
+        connections = set()
+
+        def do_GET(self):
+            ImageHandler.connections.add(self.client_address)
+            time.sleep(latency)
+            if self.path.startswith('/missing'):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(IMAGE_BYTES)))
+            self.end_headers()
+            self.wfile.write(IMAGE_BYTES)
+
+        def log_message(self, *args):
+            pass
+
+    return ImageHandler
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # Clients dropping connections at the deadline is expected
+
+def serial_download(jobs):
+    """The previous fetch: one fresh requests.get per image"""
+    results = {}
+    for key, url, save_path in jobs:
+        try:
+            response = requests.get(url, timeout=10)
+            response.raise_for_status()
+            with open(save_path, 'wb') as f:
+                f.write(response.content)
+            results[key] = True
+        except Exception:
+            results[key] = False
+    return results
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency = (int(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+
+    # Failed downloads are expected here; keep the report readable
+    logging.disable(logging.WARNING)
+
+    handler = make_handler(latency)
+    server = QuietServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    with tempfile.TemporaryDirectory() as directory:
+        def jobs(name):
+            # Every tenth image is missing, as with deleted posts
+            return [(i, f'{base_url}/{"missing" if i % 10 == 9 else "image"}_{i}.jpg',
+                     os.path.join(directory, f'{name}_{i}.jpg')) for i in range(count)]
+
+        handler.connections.clear()
+        start = time.perf_counter()
+        serial_results = serial_download(jobs('serial'))
+        serial_time = time.perf_counter() - start
+        serial_connections = len(handler.connections)
+
+        handler.connections.clear()
+        start = time.perf_counter()
+        pooled_results = Downloader().download_all(jobs('pooled'))
+        pooled_time = time.perf_counter() - start
+        pooled_connections = len(handler.connections)
+
+        # A deadline shorter than the batch needs reports the unfinished downloads as failed
+        start = time.perf_counter()
+        deadline_results = Downloader().download_all(jobs('deadline'), workers=2, deadline=latency * 3)
+        deadline_time = time.perf_counter() - start
+        time.sleep(latency * 2)
+        leftovers = [name for name in os.listdir(directory) if name.startswith('deadline_')]
+
+    server.shutdown()
+
+    print(f"Images:    {count} x {len(IMAGE_BYTES) // 1024} KiB, {latency * 1000:.0f} ms latency")
+    print(f"Serial:    {serial_time:.2f}s, {sum(serial_results.values())} saved, {serial_connections} connections")
+    print(f"Pooled:    {pooled_time:.2f}s, {sum(pooled_results.values())} saved, {pooled_connections} connections")
+    print(f"Speedup:   {serial_time / pooled_time:.1f}x, same results: {serial_results == pooled_results}")
+    print(f"Deadline:  {deadline_time:.2f}s, {sum(deadline_results.values())} saved, "
+          f"{len(leftovers)} files on disk afterwards")
+
+if __name__ == '__main__':
+    main()
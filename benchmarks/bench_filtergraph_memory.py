@@ -0,0 +1,82 @@
+"""
+Measure the peak memory of the single-pass (filtergraph) engine on a long compilation of
+camera-sized images, rendering a regular video and a short of its first memes together
+
+FFmpeg is the only child process waited on here, so the children's peak RSS is FFmpeg's.
+
+Usage: python benchmarks/bench_filtergraph_memory.py [meme_count] [profile]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from services.video_service import get_filtergraph_chunk_size, get_video_dimensions, render_filtergraph_renditions
+
+DISTINCT_IMAGES = 20
+
+def make_media(directory):
+    """12 MP JPEGs like phone photos, a few seconds of speech-length WAV audio"""
+    image_paths = []
+    for i in range(DISTINCT_IMAGES):
+        img = Image.effect_noise((4000, 3000) if i % 2 else (2000, 3000), 30 + i).convert('RGB')
+        ImageDraw.Draw(img).rectangle((0, 0, img.width, img.height // 6), fill=(255, 255, 255))
+        image_paths.append(os.path.join(directory, f'image_{i}.jpg'))
+        img.save(image_paths[-1], quality=85)
+
+    audio_path = os.path.join(directory, 'speech.wav')
+    with wave.open(audio_path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(22050)
+        f.writeframes(os.urandom(22050 * 2 * 2))
+    return image_paths, audio_path
+
+def probe_duration(path):
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+        capture_output=True, text=True, timeout=30
+    )
+    return float(result.stdout.strip()) if result.returncode == 0 else None
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    profile = sys.argv[2] if len(sys.argv) > 2 else 'draft'
+    shorts_count = min(count, 15)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Keep the frames this run prepares out of the app's cache
+        os.environ.setdefault('FRAME_CACHE_DIR', os.path.join(directory, 'frames'))
+        image_paths, audio_path = make_media(directory)
+        memes = [
+            {'image_path': image_paths[i % DISTINCT_IMAGES], 'audio_path': audio_path if i % 3 else None,
+             'duration': 1.0}
+            for i in range(count)
+        ]
+        renditions = [
+            (os.path.join(directory, f'{video_type}.mp4'), *get_video_dimensions(video_type, profile), meme_count)
+            for video_type, meme_count in (('regular', count), ('shorts', shorts_count))
+        ]
+
+        start = time.perf_counter()
+        ok = render_filtergraph_renditions(memes, renditions, profile=profile)
+        elapsed = time.perf_counter() - start
+        peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        durations = [probe_duration(rendition[0]) if ok else None for rendition in renditions]
+
+    video_width, video_height = get_video_dimensions('regular', profile)
+    print(f"Memes:      {count} at {video_width}x{video_height} ({profile}), first {shorts_count} also in the short")
+    print(f"Chunks:     up to {get_filtergraph_chunk_size()} memes per FFmpeg process")
+    print(f"Render:     {'ok' if ok else 'FAILED'} in {elapsed:.1f}s")
+    print(f"Peak RSS:   {peak_rss:.0f} MiB (largest FFmpeg process)")
+    print(f"Durations:  regular {durations[0]}s (planned {count * 3.0:.1f}s), "
+          f"short {durations[1]}s (planned {shorts_count * 3.0:.1f}s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark in-process WAV/GIF duration probing against the ffprobe subprocess path
+
+Usage: python benchmarks/bench_media_probe.py [file_count]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from services.media_probe import probe_media_duration
+
+def ffprobe_duration(media_path):
+    """The subprocess path used before in-process probing"""
+    cmd = [
+        'ffprobe', '-v', 'quiet', '-show_entries', 'format=duration',
+        '-of', 'csv=p=0', media_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+    return float(result.stdout.strip()) if result.returncode == 0 else None
+
+def make_samples(directory, count):
+    """Write count WAVs (TTS-like mono 16-bit) and count animated GIFs of varying length"""
+    paths = []
+    for i in range(count):
+        wav_path = os.path.join(directory, f'sample_{i}.wav')
+        with wave.open(wav_path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(22050)
+            wav.writeframes(b'\0\0' * 22050 * (1 + i % 8))
+        paths.append(wav_path)
+
+        gif_path = os.path.join(directory, f'sample_{i}.gif')
+        frames = [Image.new('P', (64, 64), color) for color in range(2 + i % 10)]
+        frames[0].save(gif_path, save_all=True, append_images=frames[1:], duration=40 + 10 * (i % 5), loop=0)
+        paths.append(gif_path)
+    return paths
+
+def time_probe(probe, paths):
+    start = time.perf_counter()
+    results = [probe(path) for path in paths]
+    return time.perf_counter() - start, results
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_samples(directory, count)
+
+        native_time, native = time_probe(probe_media_duration, paths)
+        ffprobe_time, probed = time_probe(ffprobe_duration, paths)
+
+        mismatches = [
+            (path, a, b) for path, a, b in zip(paths, native, probed)
+            if a is None or b is None or abs(a - b) > 0.05
+        ]
+
+        print(f"Files probed:   {len(paths)}")
+        print(f"In-process:     {native_time:.3f}s ({native_time / len(paths) * 1000:.2f} ms/file)")
+        print(f"ffprobe:        {ffprobe_time:.3f}s ({ffprobe_time / len(paths) * 1000:.2f} ms/file)")
+        print(f"Speedup:        {ffprobe_time / native_time:.1f}x")
+        print(f"Mismatches:     {len(mismatches)}")
+        for path, a, b in mismatches[:10]:
+            print(f"  {os.path.basename(path)}: in-process={a} ffprobe={b}")
+
+if __name__ == '__main__':
+    main()
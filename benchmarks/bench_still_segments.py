@@ -0,0 +1,96 @@
+"""
+Benchmark the still-image segment encode against the full frame rate encode it replaced
+
+Usage: python benchmarks/bench_still_segments.py [image_count] [profile]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from services.video_service import (
+    STILL_FRAME_FILTER, build_ffmpeg_command, get_encode_profile, get_video_dimensions, letterbox_image,
+    raw_frame_input, run_ffmpeg, segment_frame_count, still_segment_command
+)
+
+def full_rate_command(output_path, video_width, video_height, duration, profile):
+    """The previous segment command: every frame encoded at the profile's frame rate"""
+    fps = get_encode_profile(profile)['fps']
+    return build_ffmpeg_command(
+        [raw_frame_input(video_width, video_height, fps)], output_path, profile,
+        video_filter=STILL_FRAME_FILTER, audio=False,
+        output_args=['-frames:v', str(segment_frame_count(duration, fps))]
+    )
+
+def make_frames(count, video_width, video_height):
+    """Letterboxed raw frames of meme-like pictures (flat areas, text-like detail)"""
+    frames = []
+    for i in range(count):
+        img = Image.effect_noise((600 + 40 * i, 500 + 30 * (i % 5)), 40 + i % 30).convert('RGB')
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((0, 0, img.width, img.height // 5), fill=(255, 255, 255))
+        for line in range(4):
+            draw.text((20, 10 + 20 * line), f'meme caption line {line} ' * 3, fill=(0, 0, 0))
+        frames.append(letterbox_image(img, video_width, video_height).tobytes())
+    return frames
+
+def probe_duration(path):
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+        capture_output=True, text=True, timeout=30
+    )
+    return float(result.stdout.strip()) if result.returncode == 0 else None
+
+def time_segments(make_command, frames, durations, directory, name, video_width, video_height, profile):
+    """Encode one segment per frame; returns (seconds, total bytes, durations written)"""
+    elapsed = 0.0
+    total_bytes = 0
+    written = []
+    for i, (frame, duration) in enumerate(zip(frames, durations)):
+        output_path = os.path.join(directory, f'{name}_{i}.mp4')
+        cmd = make_command(output_path, video_width, video_height, duration, profile)
+        start = time.perf_counter()
+        result = run_ffmpeg(cmd, 300, input_data=frame)
+        elapsed += time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"{name} encode failed: {result.stderr}")
+        total_bytes += os.path.getsize(output_path)
+        written.append(probe_duration(output_path))
+    return elapsed, total_bytes, written
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    profile = sys.argv[2] if len(sys.argv) > 2 else 'standard'
+    video_width, video_height = get_video_dimensions('regular', profile)
+
+    # Alternate 1s gaps with meme-length segments, as in a compilation
+    durations = [1.0 if i % 2 == 0 else 2.0 + (i % 7) for i in range(count)]
+    frames = make_frames(count, video_width, video_height)
+
+    with tempfile.TemporaryDirectory() as directory:
+        full_time, full_bytes, full_durations = time_segments(
+            full_rate_command, frames, durations, directory, 'full', video_width, video_height, profile
+        )
+        still_time, still_bytes, still_durations = time_segments(
+            still_segment_command, frames, durations, directory, 'still', video_width, video_height, profile
+        )
+
+    mismatches = [
+        (i, a, b) for i, (a, b) in enumerate(zip(full_durations, still_durations))
+        if a is None or b is None or abs(a - b) > 0.001
+    ]
+
+    print(f"Segments:       {count} at {video_width}x{video_height} ({profile}), {sum(durations):.0f}s of video")
+    print(f"Full rate:      {full_time:.2f}s, {full_bytes / 1024:.0f} KiB")
+    print(f"Still image:    {still_time:.2f}s, {still_bytes / 1024:.0f} KiB")
+    print(f"Speedup:        {full_time / still_time:.1f}x, size {still_bytes / full_bytes:.0%} of full rate")
+    print(f"Length changes: {len(mismatches)}")
+    for i, a, b in mismatches[:10]:
+        print(f"  segment {i}: full rate={a} still={b}")
+
+if __name__ == '__main__':
+    main()
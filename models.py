@@ -3,6 +3,27 @@ from flask_sqlalchemy import SQLAlchemy
 # This will be initialized in app.py
 db = SQLAlchemy()
 
+def upgrade_schema():
+    """Add columns introduced after a table was created (create_all never alters existing tables)"""
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            statement = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+            if column.default is not None and column.default.is_scalar:
+                default = column.default.arg
+                statement += f' DEFAULT {int(default) if isinstance(default, bool) else repr(default)}'
+            db.session.execute(db.text(statement))
+
+    db.session.commit()
+
 class User(db.Model):
     """User model for authentication"""
     id = db.Column(db.Integer, primary_key=True)
@@ -22,6 +43,11 @@ class Meme(db.Model):
     # Audio storage
     audio_path = db.Column(db.String(500))  # Local audio file path
 
+    # Media durations, probed once and reused for planning and rendering
+    audio_duration = db.Column(db.Float)  # Seconds of generated audio
+    gif_duration = db.Column(db.Float)  # Natural loop duration for GIFs
+    loop_video_path = db.Column(db.String(500))  # GIF transcoded once to a looping H.264 intermediate
+
     # Workflow status tracking
     text_approved = db.Column(db.Boolean, default=False)  # Text phase approval
     audio_approved = db.Column(db.Boolean, default=False)  # Audio phase approval
@@ -41,6 +67,8 @@ class Configuration(db.Model):
     subreddits = db.Column(db.Text, default='memes')
     create_videos = db.Column(db.Boolean, default=True)  # Whether to create regular videos
     create_shorts = db.Column(db.Boolean, default=False)  # Whether to create shorts
+    encode_profile = db.Column(db.String(20), default='standard')  # Default encode profile for renders
+    dual_output = db.Column(db.Boolean, default=True)  # Render shorts alongside regular videos in one pass
 
 class GeneratedVideo(db.Model):
     """Model for tracking generated videos"""
@@ -53,4 +81,23 @@ class GeneratedVideo(db.Model):
     meme_ids = db.Column(db.Text)  # JSON string of meme IDs used in this video
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
+class RenderJob(db.Model):
+    """Model for queued video renders processed by the background worker"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    video_type = db.Column(db.String(20))  # 'regular', 'shorts' or None for all enabled types
+    engine = db.Column(db.String(20), default='segments')  # Render engine name
+    encode_profile = db.Column(db.String(20), default='standard')  # Encode profile name
+    preview = db.Column(db.Boolean, default=False)  # Low-resolution proxy that doesn't consume memes
+    meme_ids = db.Column(db.Text)  # JSON list of preselected meme IDs (promoted previews)
 
+    # Job state: 'queued', 'running', 'done' or 'failed'
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    stage = db.Column(db.String(50))  # Current stage, e.g. 'segments' or 'concatenate'
+    progress = db.Column(db.Float, default=0.0)  # Overall progress percent
+    message = db.Column(db.Text)  # Final result or error message
+    result = db.Column(db.Text)  # JSON result details
+
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session
 from models import db
 from services.helpers import require_login, get_user_config
+from services.video_service import ENCODE_PROFILES
 import re
 
 config_bp = Blueprint('config', __name__)
@@ -37,7 +38,8 @@ def config():
     return render_template('config.html',
                          config=config,
                          available_subreddits=available_subreddits,
-                         selected_subreddits=selected_subreddits)
+                         selected_subreddits=selected_subreddits,
+                         encode_profiles=ENCODE_PROFILES)
 
 @config_bp.route('/update_config', methods=['POST'])
 @require_login
@@ -71,6 +73,12 @@ def update_config():
     # Handle video/shorts preferences
     config.create_videos = 'create_videos' in request.form
     config.create_shorts = 'create_shorts' in request.form
+    config.dual_output = 'dual_output' in request.form
+
+    # Default encode profile for renders
+    encode_profile = request.form.get('encode_profile', 'standard')
+    if encode_profile in ENCODE_PROFILES:
+        config.encode_profile = encode_profile
 
     db.session.commit()
 
@@ -1,7 +1,11 @@
+import logging
 from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify
-from models import Meme, GeneratedVideo, db
-from services.helpers import require_login, get_user_config, save_meme_to_db
+from models import Meme, GeneratedVideo, RenderJob, db
+from services.helpers import (require_login, get_user_config, new_image_path, add_meme, update_media_durations,
+                              get_meme_duration, remove_audio_files)
 from services.reddit_service import get_top_memes
+from services.downloader import get_downloader
+from services.prerender import schedule_gif_loops, schedule_prerender
 
 memes_bp = Blueprint('memes', __name__)
 
@@ -16,9 +20,11 @@ def auto_approve_textless_memes(user_id):
 
     for meme in textless_memes:
         meme.audio_approved = True
+        update_media_durations(meme)
 
     if textless_memes:
         db.session.commit()
+        schedule_prerender([meme.id for meme in textless_memes])
         return len(textless_memes)
     return 0
 
@@ -46,22 +52,37 @@ def fetch_memes():
         new_memes_count = 0
         error_count = 0
 
-        for meme_info in reddit_memes:
-            try:
-                meme_url = meme_info.get('url', '')
+        # Reddit service only filtered out current memes; discarded ones are still saved
+        saved_urls = {url for (url,) in db.session.query(Meme.url).filter_by(user_id=user_id).all()}
 
-                if not meme_url:
-                    error_count += 1
-                    continue
+        jobs = []
+        for index, meme_info in enumerate(reddit_memes):
+            meme_url = meme_info.get('url', '')
 
-                # Save new meme to database with subreddit information
-                # No need to check for duplicates here since Reddit service already filtered them
-                save_meme_to_db(user_id, meme_url, "", meme_info.get('subreddit', 'memes'))
-                new_memes_count += 1
+            if not meme_url:
+                error_count += 1
+                continue
+            if meme_url in saved_urls:
+                continue
+            jobs.append((index, meme_url, new_image_path(meme_url)))
+
+        # Download all images concurrently over pooled per-host connections
+        downloaded = get_downloader().download_all(jobs)
 
+        # Save the new memes with their subreddit information in one commit
+        new_memes = []
+        for index, meme_url, image_path in jobs:
+            try:
+                new_memes.append(add_meme(user_id, meme_url, image_path if downloaded[index] else None, "",
+                                          reddit_memes[index].get('subreddit', 'memes')))
+                new_memes_count += 1
             except Exception:
                 error_count += 1
                 continue
+        db.session.commit()
+
+        # Transcode GIFs into loop intermediates in the background instead of in this request
+        schedule_gif_loops([meme.id for meme in new_memes])
 
         # Set flash message for user feedback - only show if there are issues
         if new_memes_count == 0:
@@ -178,11 +199,7 @@ def update_meme_text():
             if audio_key in session:
                 # Try to delete the old audio file
                 old_audio_path = session[audio_key]
-                try:
-                    if os.path.exists(old_audio_path):
-                        os.remove(old_audio_path)
-                except Exception:
-                    pass  # Ignore file deletion errors
+                remove_audio_files(old_audio_path)
 
                 # Remove from session
                 session.pop(audio_key, None)
@@ -235,14 +252,11 @@ def approve_meme_text():
 
             if old_audio_path:
                 # Try to delete the old audio file
-                try:
-                    if os.path.exists(old_audio_path):
-                        os.remove(old_audio_path)
-                except Exception:
-                    pass  # Ignore file deletion errors
+                remove_audio_files(old_audio_path)
 
             # Clear from database and session
             meme.audio_path = None
+            meme.audio_duration = None
             session.pop(f'audio_path_{meme.id}', None)
 
             # Reset audio approval since text changed
@@ -317,6 +331,8 @@ def approve_meme_audio():
     if meme:
         meme.audio_approved = True
         db.session.commit()
+        # The meme's content is final now, so its segments can be encoded ahead of the render
+        schedule_prerender([meme.id])
         return jsonify({'success': True, 'message': 'Audio approved successfully'})
     else:
         return jsonify({'success': False, 'message': 'Meme not found'}), 404
@@ -325,7 +341,7 @@ def approve_meme_audio():
 @require_login
 def generate_audio():
     """Generate audio for specific meme(s) - handles both individual and bulk generation"""
-    from services.audio_service import generate_audio_from_text
+    from services.audio_service import generate_audio_from_text, generate_audio_parallel
     import uuid
     import os
 
@@ -335,6 +351,7 @@ def generate_audio():
 
     generated_count = 0
     failed_count = 0
+    results = []  # Per meme: {'meme_id', 'success'}
 
     if meme_id:
         # Generate audio for specific meme
@@ -345,11 +362,7 @@ def generate_audio():
                 old_audio_path = meme.audio_path or session.get(f'audio_path_{meme.id}')
 
                 if old_audio_path:
-                    try:
-                        if os.path.exists(old_audio_path):
-                            os.remove(old_audio_path)
-                    except Exception:
-                        pass  # Ignore file deletion errors
+                    remove_audio_files(old_audio_path)
 
                 # Clear from database and session
                 meme.audio_path = None
@@ -366,6 +379,7 @@ def generate_audio():
                 if generate_audio_from_text(current_text, audio_path):
                     # Store audio path in both database and session
                     meme.audio_path = audio_path
+                    update_media_durations(meme)
                     db.session.commit()
                     session[f'audio_path_{meme.id}'] = audio_path
                     generated_count = 1
@@ -375,6 +389,7 @@ def generate_audio():
             except Exception as e:
                 failed_count = 1
                 session['flash_message'] = f"Error generating audio: {str(e)}"
+            results.append({'meme_id': meme.id, 'success': generated_count == 1})
         else:
             session['flash_message'] = "Invalid meme or no text content."
 
@@ -387,20 +402,19 @@ def generate_audio():
             audio_approved=False
         ).filter((Meme.text != None) & (Meme.text != '')).all()
 
+        # Clear existing audio and queue every meme for synthesis
+        batch = []
         for meme in memes:
             try:
                 # Clear any existing audio first (regenerate all) from both database and session
                 old_audio_path = meme.audio_path or session.get(f'audio_path_{meme.id}')
 
                 if old_audio_path:
-                    try:
-                        if os.path.exists(old_audio_path):
-                            os.remove(old_audio_path)
-                    except Exception:
-                        pass  # Ignore file deletion errors
+                    remove_audio_files(old_audio_path)
 
                 # Clear from database and session
                 meme.audio_path = None
+                meme.audio_duration = None
                 session.pop(f'audio_path_{meme.id}', None)
 
                 # Generate unique audio filename
@@ -408,23 +422,40 @@ def generate_audio():
                 audio_path = os.path.join('static', 'audio', audio_filename)
 
                 # Get the current text from database (ensure it's fresh)
-                current_text = meme.text.strip()
+                batch.append((meme, meme.text.strip(), audio_path))
+            except Exception:
+                failed_count += 1
+                results.append({'meme_id': meme.id, 'success': False})
+                continue
 
-                # Generate audio using the current text
-                if generate_audio_from_text(current_text, audio_path):
+        # The old files are gone, so no row may keep pointing at them if synthesis fails
+        db.session.commit()
+
+        # Spread synthesis over the TTS worker processes and save each meme as its audio arrives,
+        # so a crash part-way keeps everything generated so far
+        batch_by_id = {meme.id: (meme, audio_path) for meme, _, audio_path in batch}
+        items = [(meme.id, text, audio_path) for meme, text, audio_path in batch]
+        try:
+            for batch_meme_id, generated in generate_audio_parallel(items):
+                meme, audio_path = batch_by_id.pop(batch_meme_id)
+                if generated:
                     # Store audio path in both database and session
                     meme.audio_path = audio_path
+                    update_media_durations(meme)
                     session[f'audio_path_{meme.id}'] = audio_path
                     generated_count += 1
                 else:
                     failed_count += 1
-            except Exception:
-                failed_count += 1
-                continue
+                db.session.commit()
+                results.append({'meme_id': meme.id, 'success': generated})
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Bulk audio generation stopped: {e}")
 
-        # Commit all changes for bulk generation
-        if generated_count > 0:
-            db.session.commit()
+        # Memes the run never got to
+        for meme, _ in batch_by_id.values():
+            failed_count += 1
+            results.append({'meme_id': meme.id, 'success': False})
 
         # Set appropriate flash message only for failures
         if generated_count > 0 and failed_count > 0:
@@ -442,13 +473,13 @@ def generate_audio():
     if request.headers.get('Content-Type') == 'application/x-www-form-urlencoded':
         # This is likely an AJAX request, return JSON
         if generated_count > 0 and failed_count == 0:
-            return jsonify({'success': True})  # No message for successful generation
+            return jsonify({'success': True, 'results': results})  # No message for successful generation
         elif generated_count > 0 and failed_count > 0:
-            return jsonify({'success': True, 'message': f'Generated audio for {generated_count} memes. {failed_count} failed.'})
+            return jsonify({'success': True, 'message': f'Generated audio for {generated_count} memes. {failed_count} failed.', 'results': results})
         elif generated_count == 0 and failed_count > 0:
-            return jsonify({'success': False, 'message': f'Failed to generate audio for {failed_count} memes.'})
+            return jsonify({'success': False, 'message': f'Failed to generate audio for {failed_count} memes.', 'results': results})
         else:
-            return jsonify({'success': False, 'message': 'No audio files could be generated.'})
+            return jsonify({'success': False, 'message': 'No audio files could be generated.', 'results': results})
     else:
         # Regular form submission, redirect as before
         return redirect(url_for('memes.audio_workshop'))
@@ -457,7 +488,8 @@ def generate_audio():
 @require_login
 def video_workshop():
     """Video Workshop - Show memes ready for video generation and generated videos"""
-    from services.video_service import calculate_video_requirements, get_audio_duration
+    from services.video_service import calculate_video_requirements, ENCODE_PROFILES
+    import json
     import os
 
     user_id = session['user_id']
@@ -481,11 +513,8 @@ def video_workshop():
         # Get audio path from database first, then fall back to session
         audio_path = meme.audio_path or session.get(f'audio_path_{meme.id}')
 
-        # Calculate duration
-        if audio_path and os.path.exists(audio_path):
-            duration = get_audio_duration(audio_path)
-        else:
-            duration = 3.0  # Default for memes without audio
+        # Use the stored duration (3s default for memes without audio)
+        duration = get_meme_duration(meme, audio_path)
 
         memes_data.append({
             'meme_id': meme.id,
@@ -514,179 +543,158 @@ def video_workshop():
     # Get generated videos
     generated_videos = GeneratedVideo.query.filter_by(user_id=user_id).order_by(GeneratedVideo.created_at.desc()).all()
 
+    # Render jobs still in progress, so the page can resume polling them
+    active_jobs = RenderJob.query.filter(
+        RenderJob.user_id == user_id,
+        RenderJob.status.in_(['queued', 'running'])
+    ).order_by(RenderJob.created_at).all()
+
+    # Latest finished preview whose proxies are still on disk, offered for promotion
+    preview_job = RenderJob.query.filter_by(
+        user_id=user_id, preview=True, status='done'
+    ).order_by(RenderJob.finished_at.desc()).first()
+    previews = []
+    if preview_job and preview_job.result:
+        previews = [dict(p, index=index) for index, p in enumerate(json.loads(preview_job.result).get('previews', []))
+                    if os.path.exists(p['video_path'])]
+
     return render_template('video_workshop.html',
                          memes_by_subreddit=memes_by_subreddit,
                          generated_videos=generated_videos,
+                         active_jobs=active_jobs,
+                         preview_job=preview_job,
+                         previews=previews,
                          config=config,
-                         requirements=requirements)
+                         requirements=requirements,
+                         encode_profiles=ENCODE_PROFILES)
 
 @memes_bp.route('/generate_videos', methods=['POST'])
 @require_login
 def generate_videos():
-    """Generate compilation videos based on user settings"""
-    from services.video_service import generate_compilation_video, get_audio_duration
+    """Queue compilation video generation based on user settings"""
+    from services.video_service import RENDER_ENGINES, ENCODE_PROFILES
+    from services.render_jobs import enqueue_render_job
     import os
-    import logging
 
     user_id = session['user_id']
-    config = get_user_config(user_id)
 
     # Check if specific video type is requested
-    requested_type = request.form.get('video_type')  # 'regular' or 'shorts'
+    requested_type = request.form.get('video_type') or None  # 'regular' or 'shorts'
+
+    # Render engine: 'segments' (default) or 'filtergraph' (single-pass)
+    engine = request.form.get('engine', 'segments')
+    if engine not in RENDER_ENGINES:
+        return jsonify({'success': False, 'message': f'Unknown render engine: {engine}'})
 
-    logging.info(f"Starting video generation for user {user_id}")
-    logging.info(f"Config: create_videos={config.create_videos}, create_shorts={config.create_shorts}")
-    logging.info(f"Requested type: {requested_type}")
+    # Preview renders a quick low-resolution proxy without using up the memes
+    preview = request.form.get('preview') == '1'
+
+    # Encode profile: per-render choice, falling back to the user's configured default
+    profile = request.form.get('profile') or get_user_config(user_id).encode_profile or 'standard'
+    if profile not in ENCODE_PROFILES:
+        return jsonify({'success': False, 'message': f'Unknown encode profile: {profile}'})
 
-    # Get memes ready for video generation
     ready_memes = Meme.query.filter_by(
         user_id=user_id,
         discarded=False,
         text_approved=True,
         audio_approved=True
-    ).order_by(Meme.created_at).all()
-
-    logging.info(f"Found {len(ready_memes)} ready memes")
+    ).all()
 
     if not ready_memes:
         return jsonify({'success': False, 'message': 'No memes ready for video generation.'})
 
-    # Prepare memes data for video generation
-    memes_data = []
+    # The worker has no session, so persist audio that is only known to the session
     for meme in ready_memes:
-        # Get audio path from database first, then fall back to session
-        audio_path = meme.audio_path or session.get(f'audio_path_{meme.id}')
+        session_audio_path = session.get(f'audio_path_{meme.id}')
+        if not meme.audio_path and session_audio_path and os.path.exists(session_audio_path):
+            meme.audio_path = session_audio_path
+            update_media_durations(meme)
+    db.session.commit()
 
-        # Verify image path exists
-        if not meme.image_path or not os.path.exists(meme.image_path):
-            logging.error(f"Image not found for meme {meme.id}: {meme.image_path}")
-            continue
+    job = enqueue_render_job(user_id, requested_type, engine, profile, preview=preview)
+    return jsonify({'success': True, 'job_id': job.id, 'message': 'Video generation queued.'})
 
-        # Calculate duration
-        if audio_path and os.path.exists(audio_path):
-            duration = get_audio_duration(audio_path)
-            logging.info(f"Meme {meme.id}: audio duration {duration}s")
-        else:
-            duration = 3.0  # Default for memes without audio
-            audio_path = None
-            logging.info(f"Meme {meme.id}: no audio, using default 3s duration")
+@memes_bp.route('/promote_preview', methods=['POST'])
+@require_login
+def promote_preview():
+    """Queue a full render of a preview with exactly the same meme selection"""
+    from services.video_service import RENDER_ENGINES, ENCODE_PROFILES
+    from services.render_jobs import enqueue_render_job
+    import json
 
-        memes_data.append({
-            'meme_id': meme.id,
-            'image_path': meme.image_path,
-            'audio_path': audio_path,
-            'duration': duration
-        })
+    user_id = session['user_id']
+    job_id = request.form.get('job_id', type=int)
+    preview_index = request.form.get('preview_index', type=int)
 
-    logging.info(f"Prepared {len(memes_data)} memes for video generation")
-
-    if not memes_data:
-        return jsonify({'success': False, 'message': 'No valid memes found for video generation.'})
-
-    videos_generated = []
-    errors = []
-
-    # Generate regular videos if enabled and requested
-    if config.create_videos and (not requested_type or requested_type == 'regular'):
-        # Filter memes that haven't been used in regular videos
-        regular_memes = [m for m in memes_data if not ready_memes[memes_data.index(m)].used_in_regular_video]
-
-        logging.info(f"Regular videos enabled. Total memes_data: {len(memes_data)}, Available for regular: {len(regular_memes)}")
-        for i, _ in enumerate(memes_data):
-            meme = ready_memes[i]
-            logging.info(f"Meme {meme.id}: used_in_regular_video={meme.used_in_regular_video}")
-
-        if regular_memes:
-            success, video_path, actual_duration, memes_used, used_meme_ids = generate_compilation_video(
-                regular_memes, 'regular', 600
-            )
-
-            if success:
-                # Save video record
-                import json
-                video_record = GeneratedVideo(
-                    user_id=user_id,
-                    video_path=video_path,
-                    video_type='regular',
-                    duration=actual_duration,
-                    memes_count=memes_used,
-                    meme_ids=json.dumps(used_meme_ids)
-                )
-                db.session.add(video_record)
-
-                # Mark memes as used in regular videos
-                for meme_id in used_meme_ids:
-                    meme = next(m for m in ready_memes if m.id == meme_id)
-                    meme.used_in_regular_video = True
-                    # Update legacy field if used in all enabled types
-                    if not config.create_shorts or meme.used_in_shorts_video:
-                        meme.video_generated = True
-
-                videos_generated.append(f'Regular video ({memes_used} memes, {actual_duration:.1f}s)')
-            else:
-                errors.append('Insufficient content for 10-minute regular video')
-        else:
-            errors.append('No memes available for regular video (all already used)')
-
-    # Generate shorts if enabled and requested
-    if config.create_shorts and (not requested_type or requested_type == 'shorts'):
-        # Filter memes that haven't been used in shorts
-        shorts_memes = [m for m in memes_data if not ready_memes[memes_data.index(m)].used_in_shorts_video]
-
-        logging.info(f"Shorts enabled. Total memes_data: {len(memes_data)}, Available for shorts: {len(shorts_memes)}")
-        for i, _ in enumerate(memes_data):
-            meme = ready_memes[i]
-            logging.info(f"Meme {meme.id}: used_in_shorts_video={meme.used_in_shorts_video}")
-
-        if shorts_memes:
-            success, video_path, actual_duration, memes_used, used_meme_ids = generate_compilation_video(
-                shorts_memes, 'shorts', 180
-            )
-
-            if success:
-                # Save video record
-                import json
-                video_record = GeneratedVideo(
-                    user_id=user_id,
-                    video_path=video_path,
-                    video_type='shorts',
-                    duration=actual_duration,
-                    memes_count=memes_used,
-                    meme_ids=json.dumps(used_meme_ids)
-                )
-                db.session.add(video_record)
-
-                # Mark memes as used in shorts
-                for meme_id in used_meme_ids:
-                    meme = next(m for m in ready_memes if m.id == meme_id)
-                    meme.used_in_shorts_video = True
-                    # Update legacy field if used in all enabled types
-                    if not config.create_videos or meme.used_in_regular_video:
-                        meme.video_generated = True
-
-                videos_generated.append(f'Shorts video ({memes_used} memes, {actual_duration:.1f}s)')
-            else:
-                errors.append('No content available for shorts video')
-        else:
-            errors.append('No memes available for shorts (all already used)')
+    preview_job = RenderJob.query.filter_by(id=job_id, user_id=user_id, preview=True, status='done').first()
+    if not preview_job or not preview_job.result:
+        return jsonify({'success': False, 'message': 'Preview not found'})
 
-    # Commit changes
-    if videos_generated:
-        db.session.commit()
+    # A preview render can hold several compilations per video type
+    previews = json.loads(preview_job.result).get('previews', [])
+    if preview_index is None or not 0 <= preview_index < len(previews):
+        return jsonify({'success': False, 'message': 'No such preview in this render'})
+    preview = previews[preview_index]
 
-    # Prepare response
-    if videos_generated and not errors:
-        message = f"Generated: {', '.join(videos_generated)}"
-        logging.info(f"Video generation completed successfully: {message}")
-        return jsonify({'success': True, 'message': message})
-    elif videos_generated and errors:
-        message = f"Generated: {', '.join(videos_generated)}. Errors: {', '.join(errors)}"
-        logging.warning(f"Video generation completed with errors: {message}")
-        return jsonify({'success': True, 'message': message})
-    else:
-        message = f"Failed to generate videos. Errors: {', '.join(errors)}"
-        logging.error(f"Video generation failed: {message}")
-        return jsonify({'success': False, 'message': message})
+    engine = request.form.get('engine') or preview_job.engine or 'segments'
+    if engine not in RENDER_ENGINES:
+        return jsonify({'success': False, 'message': f'Unknown render engine: {engine}'})
+
+    profile = request.form.get('profile') or preview_job.encode_profile or 'standard'
+    if profile not in ENCODE_PROFILES:
+        return jsonify({'success': False, 'message': f'Unknown encode profile: {profile}'})
+
+    job = enqueue_render_job(user_id, preview['video_type'], engine, profile, meme_ids=preview['meme_ids'])
+    return jsonify({'success': True, 'job_id': job.id, 'message': 'Final render queued.'})
+
+@memes_bp.route('/render_jobs/<int:job_id>')
+@require_login
+def render_job_status(job_id):
+    """Poll the status and progress of a render job"""
+    from services.render_jobs import job_to_dict
+
+    job = RenderJob.query.filter_by(id=job_id, user_id=session['user_id']).first()
+    if not job:
+        return jsonify({'success': False, 'message': 'Render job not found'}), 404
+
+    return jsonify({'success': True, 'job': job_to_dict(job)})
+
+@memes_bp.route('/render_jobs/<int:job_id>/events')
+@require_login
+def render_job_events(job_id):
+    """Stream live render progress (stage, segment, percent, encode speed) as Server-Sent Events"""
+    from flask import Response, stream_with_context
+    from services.render_jobs import job_to_dict
+    from services.render_progress import wait_for_progress
+    import json
+
+    job = RenderJob.query.filter_by(id=job_id, user_id=session['user_id']).first()
+    if not job:
+        return jsonify({'success': False, 'message': 'Render job not found'}), 404
+
+    def stream():
+        # Start with what the job table knows, then follow live updates
+        state = job_to_dict(job)
+        version = 0
+        while True:
+            yield f"data: {json.dumps(state)}\n\n"
+            if state.get('status') in ('done', 'failed'):
+                break
+
+            live_state, version = wait_for_progress(job_id, version, timeout=10)
+            if live_state is not None:
+                state = live_state
+            else:
+                # Nothing live in this process (still queued or rendering elsewhere)
+                db.session.expire_all()
+                current_job = db.session.get(RenderJob, job_id)
+                if current_job is None:
+                    break
+                state = job_to_dict(current_job)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @memes_bp.route('/discard_video', methods=['POST'])
 @require_login
@@ -1,62 +1,427 @@
 import pyttsx3
 import os
 import logging
+import subprocess
+import threading
+import time
+import unicodedata
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from services.audio_timeline import normalize_wav
+from services.disk_cache import DiskCache, link_or_copy, make_cache_key
+from services.helpers import audio_preview_path, remove_audio_files
+from services.process_pool import discard_process_pool, get_pool_workers, get_process_pool
 
-def generate_audio_from_text(text, output_path):
-    """Generate audio file from text using TTS with improved settings"""
-    try:
-        # Validate input text
-        if not text or not isinstance(text, str):
-            logging.error("Invalid text input for audio generation")
-            return False
+# Speech settings: 10-15% slower speech rate (user preference), first available voice
+TTS_RATE = 135  # Reduced from 150 (10% slower)
+TTS_MAX_TEXT_LENGTH = 500
 
-        # Clean up the text
-        clean_text = text.strip()
-        if not clean_text:
-            clean_text = "No text provided for this meme."
+# Largest batch a TTS worker process renders before reporting back, so bulk results can be
+# saved while the rest are still being synthesized
+TTS_CHUNK_SIZE = 8
 
-        # Ensure the text is not too long
-        if len(clean_text) > 500:
-            clean_text = clean_text[:500] + "..."
+# Bump when synthesis settings change in a way the cache key doesn't capture
+TTS_CACHE_VERSION = 2
 
-        # Initialize TTS engine
-        engine = pyttsx3.init()
+# Speech-sized AAC for the browser players; renders use the full WAV
+AUDIO_PREVIEW_BITRATE = '48k'
 
-        # Set properties for better quality and user preferences
-        # 10-15% slower speech rate (user preference)
-        engine.setProperty('rate', 135)  # Reduced from 150 (10% slower)
+class TTSEngineManager:
+    """
+    Keeps one initialized pyttsx3 engine warm for the process and synthesizes in batches
 
-        # Try to set a better voice if available
-        voices = engine.getProperty('voices')
-        if voices and len(voices) > 0:
-            # Use the first available voice (could be enhanced to prefer female/male)
-            engine.setProperty('voice', voices[0].id)
+    Engine start-up and voice enumeration happen once instead of per meme, and every job
+    of a batch is queued with save_to_file before a single runAndWait() renders them all.
+    Some drivers (pyttsx3 2.99's espeak) only write the last file of such a batch, so any
+    output still missing afterwards is rendered again on its own on the warm engine.
+    pyttsx3 engines are not thread-safe, so batches are serialized.
+    """
 
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    def __init__(self):
+        self._engine = None
+        self._voice_id = None
+        self._lock = threading.Lock()
+        self._utterance_starts = {}
+        self._utterance_times = {}
 
-        # Remove existing file if it exists
-        if os.path.exists(output_path):
-            try:
-                os.remove(output_path)
-            except Exception:
-                pass  # Ignore file deletion errors
+    def _get_engine(self):
+        if self._engine is None:
+            start = time.perf_counter()
+            engine = pyttsx3.init()
 
-        # Ensure output path has .wav extension for better compatibility
-        if not output_path.lower().endswith('.wav'):
-            output_path = output_path.rsplit('.', 1)[0] + '.wav'
+            # Set properties for better quality and user preferences
+            engine.setProperty('rate', TTS_RATE)
 
-        # Generate audio file
-        engine.save_to_file(clean_text, output_path)
-        engine.runAndWait()
+            # Try to set a better voice if available
+            voices = engine.getProperty('voices')
+            if voices and len(voices) > 0:
+                # Use the first available voice (could be enhanced to prefer female/male)
+                self._voice_id = voices[0].id
+                engine.setProperty('voice', self._voice_id)
 
-        # Verify file was created and has reasonable size
-        if os.path.exists(output_path) and os.path.getsize(output_path) > 1000:  # At least 1KB
+            engine.connect('started-utterance', self._on_started)
+            engine.connect('finished-utterance', self._on_finished)
+            self._engine = engine
+            logging.info(f"TTS engine initialized in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return self._engine
+
+    def _on_started(self, name):
+        self._utterance_starts[name] = time.perf_counter()
+
+    def _on_finished(self, name, completed=True):
+        started = self._utterance_starts.pop(name, None)
+        if started is not None:
+            self._utterance_times[name] = time.perf_counter() - started
+
+    @property
+    def voice_id(self):
+        """Voice the engine speaks with (None until the engine is initialized, or if it has none)"""
+        with self._lock:
+            self._get_engine()
+            return self._voice_id
+
+    def _run(self, jobs):
+        """Queue (text, output_path) jobs on the engine and render them with one runAndWait()"""
+        try:
+            engine = self._get_engine()
+            for text, output_path in jobs:
+                engine.save_to_file(text, output_path, name=output_path)
+            engine.runAndWait()
             return True
-        else:
-            logging.error(f"❌ Audio file was not created or is too small: {output_path}")
+        except Exception as e:
+            # Start from a fresh engine next time rather than reuse a broken one
+            logging.error(f"❌ TTS batch failed: {e}")
+            self._engine = None
             return False
 
+    def synthesize_batch(self, jobs):
+        """
+        Render (text, output_path) jobs into WAV files, queued together for one runAndWait() call
+
+        Returns:
+            list: Per job, a dict with 'ok' (file written and at least 1KB) and 'seconds'
+                (synthesis time of the utterance, None if the driver didn't report it)
+        """
+        if not jobs:
+            return []
+
+        with self._lock:
+            batch_start = time.perf_counter()
+            self._utterance_starts.clear()
+            self._utterance_times.clear()
+            self._run(jobs)
+
+            if len(jobs) > 1:
+                missing = [(text, output_path) for text, output_path in jobs if not os.path.exists(output_path)]
+                if missing:
+                    logging.warning(f"TTS batch left {len(missing)} of {len(jobs)} files unwritten, "
+                                    f"rendering them one at a time")
+                for job in missing:
+                    self._run([job])
+
+            results = []
+            for _, output_path in jobs:
+                # Verify file was created and has reasonable size
+                ok = os.path.exists(output_path) and os.path.getsize(output_path) > 1000  # At least 1KB
+                seconds = self._utterance_times.get(output_path)
+                results.append({'ok': ok, 'seconds': seconds})
+                if ok and seconds is not None:
+                    logging.info(f"TTS utterance {output_path}: {seconds * 1000:.0f} ms")
+
+            batch_seconds = time.perf_counter() - batch_start
+            succeeded = sum(result['ok'] for result in results)
+            logging.info(f"TTS batch of {len(jobs)} utterances ({succeeded} ok) took {batch_seconds * 1000:.0f} ms "
+                         f"({batch_seconds / len(jobs) * 1000:.0f} ms per utterance)")
+            return results
+
+_engine_manager = None
+_engine_manager_lock = threading.Lock()
+
+def get_tts_engine():
+    """The process-wide TTS engine manager"""
+    global _engine_manager
+    with _engine_manager_lock:
+        if _engine_manager is None:
+            _engine_manager = TTSEngineManager()
+        return _engine_manager
+
+def _reset_engine_after_fork():
+    """Give a forked worker process an engine of its own instead of a copy of the parent's"""
+    global _engine_manager, _engine_manager_lock
+    _engine_manager = None
+    _engine_manager_lock = threading.Lock()
+    # pyttsx3.init() hands back live engines by driver; a forked copy of the parent's can't be used
+    pyttsx3._activeEngines.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_engine_after_fork)
+
+def clean_tts_text(text):
+    """Text as it will be spoken: Unicode- and whitespace-normalized, with a placeholder for empty text and a length cap"""
+    # NFKC folds look-alike characters (full-width letters, ligatures) so equal captions share a cache entry
+    clean_text = ' '.join(unicodedata.normalize('NFKC', text).split())
+    if not clean_text:
+        clean_text = "No text provided for this meme."
+
+    # Ensure the text is not too long
+    if len(clean_text) > TTS_MAX_TEXT_LENGTH:
+        clean_text = clean_text[:TTS_MAX_TEXT_LENGTH] + "..."
+    return clean_text
+
+def prepare_output_path(output_path):
+    """Make room for a WAV at output_path and return the path actually written"""
+    # Ensure output directory exists
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    # Remove existing file (and its preview) if it exists
+    remove_audio_files(output_path)
+
+    # Ensure output path has .wav extension for better compatibility
+    if not output_path.lower().endswith('.wav'):
+        output_path = output_path.rsplit('.', 1)[0] + '.wav'
+    return output_path
+
+_tts_cache = None
+
+def get_tts_cache():
+    """Persistent cache of synthesized speech (TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES env vars)"""
+    global _tts_cache
+    if _tts_cache is None:
+        directory = os.getenv('TTS_CACHE_DIR', os.path.join('instance', 'cache', 'tts'))
+        try:
+            max_bytes = int(os.getenv('TTS_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+        except ValueError:
+            max_bytes = 256 * 1024 ** 2
+        _tts_cache = DiskCache(directory, max_bytes)
+    return _tts_cache
+
+def tts_cache_key(text):
+    """Content-addressed key for the speech of cleaned text with the engine's voice and rate"""
+    return make_cache_key('tts', TTS_CACHE_VERSION, text, get_tts_engine().voice_id, TTS_RATE)
+
+def prepare_tts_job(text, output_path):
+    """A (spoken text, output path) job for synthesize_jobs, or None for invalid text"""
+    # Validate input text
+    if not text or not isinstance(text, str):
+        logging.error("Invalid text input for audio generation")
+        return None
+    return clean_tts_text(text), prepare_output_path(output_path)
+
+def encode_audio_preview(wav_path):
+    """
+    Encode the small AAC file the browser players load instead of the WAV
+
+    Returns:
+        bool: True if the preview was written
+    """
+    preview_path = audio_preview_path(wav_path)
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-y', '-v', 'error', '-i', wav_path, '-c:a', 'aac', '-b:a', AUDIO_PREVIEW_BITRATE,
+             '-ac', '1', '-movflags', '+faststart', preview_path],
+            capture_output=True, text=True, timeout=60
+        )
     except Exception as e:
-        logging.error(f"❌ Error generating audio: {e}")
+        logging.warning(f"Could not encode audio preview for {wav_path}: {e}")
+        return False
+    if result.returncode != 0:
+        logging.warning(f"Could not encode audio preview for {wav_path}: {result.stderr}")
+        return False
+    return True
+
+def finish_generated_audio(output_path):
+    """Normalize freshly synthesized speech to the render's sample format and encode its preview"""
+    normalize_wav(output_path)
+    encode_audio_preview(output_path)
+
+def restore_cached_audio(text, output_path):
+    """Link cached speech (and its preview) for cleaned text into output_path; returns whether there was any"""
+    cache = get_tts_cache()
+    if not cache.enabled:
+        return False
+    try:
+        key = tts_cache_key(text)
+        cached_path = cache.get(key, '.wav')
+        if not cached_path:
+            return False
+        link_or_copy(cached_path, output_path)
+
+        cached_preview = cache.path_for(key, '.m4a')
+        if os.path.exists(cached_preview):
+            link_or_copy(cached_preview, audio_preview_path(output_path))
+        elif encode_audio_preview(output_path):
+            cache.put(key, audio_preview_path(output_path), '.m4a')
+    except Exception as e:
+        logging.warning(f"Could not reuse cached audio for {output_path}: {e}")
         return False
+    logging.info(f"Reused cached audio for {output_path}")
+    return True
+
+def synthesize_jobs(jobs):
+    """
+    Synthesize prepared (text, output_path) jobs in one TTS batch and cache the results
+
+    Each generated WAV is rewritten as 44.1kHz stereo 16-bit, the format the render's audio
+    timeline uses, and gets an AAC preview next to it for the browser.
+
+    Returns:
+        list: Per job, whether its audio file was generated
+    """
+    cache = get_tts_cache()
+    generated = []
+    for (text, output_path), result in zip(jobs, get_tts_engine().synthesize_batch(jobs)):
+        if not result['ok']:
+            logging.error(f"❌ Audio file was not created or is too small: {output_path}")
+            generated.append(False)
+            continue
+
+        finish_generated_audio(output_path)
+        if cache.enabled:
+            key = tts_cache_key(text)
+            cache.put(key, output_path, '.wav')
+            if os.path.exists(audio_preview_path(output_path)):
+                cache.put(key, audio_preview_path(output_path), '.m4a')
+        generated.append(True)
+    return generated
+
+def link_generated_audio(source_path, output_path):
+    """Link generated speech (and its preview) to another output path; returns whether it worked"""
+    try:
+        link_or_copy(source_path, output_path)
+        if os.path.exists(audio_preview_path(source_path)):
+            link_or_copy(audio_preview_path(source_path), audio_preview_path(output_path))
+    except OSError as e:
+        logging.error(f"❌ Could not link audio to {output_path}: {e}")
+        return False
+    return True
+
+def render_speech(jobs):
+    """
+    Produce audio for prepared (text, output_path) jobs, linking speech already in the TTS
+    cache into place and synthesizing the rest in one TTS batch
+
+    Runs where the synthesizing engine lives (a worker process for bulk generation), since
+    the cache key includes that engine's voice.
+
+    Returns:
+        list: Per job, a dict with 'ok' (audio file generated) and 'cached' (reused from the cache)
+    """
+    results = [None] * len(jobs)
+    pending = []
+    for index, job in enumerate(jobs):
+        if restore_cached_audio(*job):
+            results[index] = {'ok': True, 'cached': True}
+        else:
+            pending.append(index)
+
+    for index, ok in zip(pending, synthesize_jobs([jobs[index] for index in pending])):
+        results[index] = {'ok': ok, 'cached': False}
+    return results
+
+def generate_audio_batch(items):
+    """
+    Generate audio files for many (text, output_path) items in one TTS batch
+
+    Speech already in the TTS cache is linked into place instead of synthesized again.
+
+    Returns:
+        list: Per item, whether its audio file was generated
+    """
+    generated = [False] * len(items)
+    try:
+        jobs = [(index, prepare_tts_job(text, output_path)) for index, (text, output_path) in enumerate(items)]
+        jobs = [(index, job) for index, job in jobs if job]
+        for (index, _), result in zip(jobs, render_speech([job for _, job in jobs])):
+            generated[index] = result['ok']
+    except Exception as e:
+        logging.error(f"❌ Error generating audio: {e}")
+    return generated
+
+def generate_audio_from_text(text, output_path):
+    """Generate audio file from text using TTS with improved settings"""
+    return generate_audio_batch([(text, output_path)])[0]
+
+def generate_audio_parallel(items):
+    """
+    Generate audio files for (key, text, output_path) items on the worker processes
+
+    Each worker process keeps its own warm engine and renders its share in batches of up to
+    TTS_CHUNK_SIZE (see render_speech), so throughput scales with cores instead of one
+    engine in series. Without worker processes (see get_process_pool) the batches run on
+    this process's engine. A failed batch fails its items rather than the whole run, and
+    items with the same cleaned text share one rendering.
+
+    Yields:
+        tuple: (key, generated) per item as soon as its batch finishes
+    """
+    # Identical captions are rendered once and linked to the other memes' paths
+    duplicates = {}
+    jobs = []
+    for key, text, output_path in items:
+        job = prepare_tts_job(text, output_path)
+        if job is None:
+            yield key, False
+        elif job[0] in duplicates:
+            duplicates[job[0]].append((key, job[1]))
+        else:
+            duplicates[job[0]] = []
+            jobs.append((key, job))
+
+    hits = misses = 0
+    job_by_key = dict(jobs)
+    for key, result in _render_parallel(jobs):
+        if result['cached']:
+            hits += 1
+        else:
+            misses += 1
+        yield key, result['ok']
+
+        text, source_path = job_by_key[key]
+        for duplicate_key, output_path in duplicates[text]:
+            linked = result['ok'] and link_generated_audio(source_path, output_path)
+            hits += linked
+            yield duplicate_key, linked
+    logging.info(f"TTS cache: {hits} hits, {misses} misses")
+
+def _render_parallel(jobs):
+    """Render (key, job) pairs in batches across the worker processes, yielding (key, render_speech result)"""
+    failed = {'ok': False, 'cached': False}
+    pool = get_process_pool() if len(jobs) > 1 else None
+    if pool is None:
+        # Keep the batches on this process's warm engine
+        for start in range(0, len(jobs), TTS_CHUNK_SIZE):
+            chunk = jobs[start:start + TTS_CHUNK_SIZE]
+            try:
+                results = render_speech([job for _, job in chunk])
+            except Exception as e:
+                logging.error(f"❌ Error generating audio: {e}")
+                results = [failed] * len(chunk)
+            yield from zip([key for key, _ in chunk], results)
+        return
+
+    # Small enough chunks that every worker gets several and results arrive steadily
+    workers = get_pool_workers()
+    chunk_size = max(1, min(TTS_CHUNK_SIZE, len(jobs) // (workers * 2)))
+    chunks = [jobs[start:start + chunk_size] for start in range(0, len(jobs), chunk_size)]
+    logging.info(f"Synthesizing {len(jobs)} utterances on {workers} worker processes in {len(chunks)} batches")
+
+    futures = {}
+    for chunk in chunks:
+        try:
+            futures[pool.submit(render_speech, [job for _, job in chunk])] = chunk
+        except Exception as e:
+            logging.error(f"❌ Could not queue TTS batch: {e}")
+            yield from ((key, failed) for key, _ in chunk)
+
+    for future in as_completed(futures):
+        chunk = futures[future]
+        try:
+            results = future.result()
+        except BrokenProcessPool as e:
+            logging.error(f"❌ TTS worker processes failed: {e}")
+            discard_process_pool(pool)
+            results = [failed] * len(chunk)
+        except Exception as e:
+            logging.error(f"❌ TTS batch failed: {e}")
+            results = [failed] * len(chunk)
+        yield from zip([key for key, _ in chunk], results)
@@ -0,0 +1,160 @@
+import logging
+import os
+import subprocess
+import uuid
+import wave
+import numpy as np
+from services.media_probe import parse_wav_header, WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT
+
+# Every compilation's audio is 44.1kHz stereo, built as 16-bit PCM and encoded once
+TIMELINE_SAMPLE_RATE = 44100
+TIMELINE_CHANNELS = 2
+
+# Sample types WAV files can be memory-mapped as, by (format tag, bits per sample)
+WAV_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.uint8,
+    (WAVE_FORMAT_PCM, 16): np.dtype('<i2'),
+    (WAVE_FORMAT_PCM, 32): np.dtype('<i4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype('<f4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype('<f8'),
+}
+
+def timeline_input():
+    """FFmpeg input arguments for a timeline piped in over stdin"""
+    return ['-f', 's16le', '-ar', str(TIMELINE_SAMPLE_RATE), '-ac', str(TIMELINE_CHANNELS), '-i', 'pipe:0']
+
+def map_wav_samples(wav_path):
+    """
+    Memory-map a WAV file's samples without reading them
+
+    Returns:
+        tuple or None: (samples as frames x channels, sample_rate), or None for formats that
+            can't be mapped (e.g. 24-bit or compressed)
+    """
+    header = parse_wav_header(wav_path)
+    if not header:
+        return None
+
+    dtype = WAV_DTYPES.get((header['format_tag'], header['bits_per_sample']))
+    channels = header['channels']
+    if dtype is None or not channels or header['block_align'] != channels * np.dtype(dtype).itemsize:
+        return None
+
+    frames = header['data_size'] // header['block_align']
+    if not frames:
+        return np.zeros((0, channels), dtype=dtype), header['sample_rate']
+    samples = np.memmap(wav_path, dtype=dtype, mode='r', offset=header['data_offset'], shape=(frames, channels))
+    return samples, header['sample_rate']
+
+def to_float(samples):
+    """Scale integer samples to floats in [-1, 1]"""
+    if samples.dtype == np.uint8:
+        return (samples.astype(np.float32) - 128.0) / 128.0
+    if np.issubdtype(samples.dtype, np.integer):
+        return samples.astype(np.float32) / float(2 ** (8 * samples.dtype.itemsize - 1))
+    return samples.astype(np.float32)
+
+def to_stereo(samples):
+    """Duplicate mono into both channels; keep the front pair of multichannel audio"""
+    if samples.shape[1] == 1:
+        return np.repeat(samples, 2, axis=1)
+    return samples[:, :2]
+
+def resample(samples, source_rate, target_rate=TIMELINE_SAMPLE_RATE):
+    """Linearly interpolate samples (frames x channels) to another sample rate"""
+    if source_rate == target_rate or not len(samples):
+        return samples
+    frames = int(round(len(samples) * target_rate / source_rate))
+    positions = np.arange(frames) * (source_rate / target_rate)
+    source_positions = np.arange(len(samples))
+    return np.stack([np.interp(positions, source_positions, samples[:, channel])
+                     for channel in range(samples.shape[1])], axis=1).astype(np.float32)
+
+def decode_with_ffmpeg(audio_path):
+    """Decode audio that can't be memory-mapped to float timeline samples with FFmpeg"""
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', audio_path, '-f', 'f32le', '-ac', str(TIMELINE_CHANNELS),
+         '-ar', str(TIMELINE_SAMPLE_RATE), '-'],
+        capture_output=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg could not decode {audio_path}: {result.stderr.decode(errors='replace')}")
+    return np.frombuffer(result.stdout, dtype='<f4').reshape(-1, TIMELINE_CHANNELS)
+
+def load_timeline_samples(audio_path):
+    """An audio file as float samples at the timeline's sample rate and channel layout"""
+    mapped = map_wav_samples(audio_path)
+    if mapped is None:
+        logging.info(f"Decoding {audio_path} with FFmpeg for the audio timeline")
+        return decode_with_ffmpeg(audio_path)
+
+    samples, sample_rate = mapped
+    return resample(to_stereo(to_float(samples)), sample_rate)
+
+def load_timeline_pcm(audio_path):
+    """An audio file as 16-bit timeline samples, mapped straight from disk when already in that format"""
+    mapped = map_wav_samples(audio_path)
+    if mapped is not None:
+        samples, sample_rate = mapped
+        if (sample_rate == TIMELINE_SAMPLE_RATE and samples.dtype == np.dtype('<i2')
+                and samples.shape[1] == TIMELINE_CHANNELS):
+            return samples
+
+    samples = load_timeline_samples(audio_path)
+    return np.clip(np.round(samples * 32767.0), -32768, 32767).astype(np.int16)
+
+def normalize_wav(wav_path):
+    """
+    Rewrite an audio file in place as a 16-bit WAV at the timeline's sample rate and layout
+
+    Renders then map the samples as they are instead of converting them every time.
+
+    Returns:
+        bool: True if the file is now in timeline format
+    """
+    # Write to a private name first so the file is never seen half-written
+    temp_path = f'{wav_path}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        samples = load_timeline_pcm(wav_path)
+        if isinstance(samples, np.memmap):
+            return True  # Already in timeline format
+
+        with wave.open(temp_path, 'wb') as wav_file:
+            wav_file.setnchannels(TIMELINE_CHANNELS)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(TIMELINE_SAMPLE_RATE)
+            wav_file.writeframes(np.ascontiguousarray(samples, dtype='<i2').tobytes())
+        os.replace(temp_path, wav_path)
+        return True
+    except Exception as e:
+        logging.warning(f"Could not normalize {wav_path} to timeline format: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+def build_audio_timeline(pieces):
+    """
+    Lay out a compilation's audio in memory
+
+    Args:
+        pieces: (duration, audio_path) per segment in playback order; audio_path None is
+            silence, and audio is cut or padded with silence to its segment's duration
+
+    Returns:
+        bytes: Interleaved 16-bit stereo PCM at TIMELINE_SAMPLE_RATE (see timeline_input)
+    """
+    # Piece boundaries come from the running time so rounding never accumulates
+    boundaries = [0]
+    elapsed = 0.0
+    for duration, _ in pieces:
+        elapsed += duration
+        boundaries.append(int(round(elapsed * TIMELINE_SAMPLE_RATE)))
+
+    timeline = np.zeros((boundaries[-1], TIMELINE_CHANNELS), dtype=np.int16)
+    for (_, audio_path), start, end in zip(pieces, boundaries, boundaries[1:]):
+        if not audio_path:
+            continue
+        samples = load_timeline_pcm(audio_path)[:end - start]
+        timeline[start:start + len(samples)] = samples
+
+    return timeline.tobytes()
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+def file_digest(path):
+    """Get the SHA-256 of a file's bytes, memoized by path, size and modification time"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    with _digest_lock:
+        digest = _digest_cache.get(memo_key)
+    if digest:
+        return digest
+
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+
+    with _digest_lock:
+        _digest_cache[memo_key] = digest
+    return digest
+
+def make_cache_key(*parts):
+    """Build a content-addressed cache key from arbitrary parts"""
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(repr(part).encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+def link_or_copy(source_path, target_path):
+    """Hard-link a file into place, copying when linking is not possible"""
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+
+# Eviction frees space down to this share of the budget, so the directory scan it needs
+# happens once per batch of evictions rather than on every put of a full cache
+EVICT_TARGET = 0.9
+
+class DiskCache:
+    """Content-addressed file cache on local disk with LRU eviction under a byte budget"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = None  # Running size of the entries, known after the first scan
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def path_for(self, key, suffix=''):
+        """Location of a cache entry, sharded by the first two characters of its key"""
+        return os.path.join(self.directory, key[:2], f'{key}{suffix}')
+
+    def get(self, key, suffix=''):
+        """Return the cached file path for key, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        path = self.path_for(key, suffix)
+        if os.path.exists(path):
+            try:
+                # Modification time doubles as the LRU timestamp
+                os.utime(path, None)
+            except OSError:
+                pass
+            with self._lock:
+                self.hits += 1
+            return path
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, source_path, suffix=''):
+        """Store a copy of source_path under key and return the cached path"""
+        if not self.enabled:
+            return None
+
+        path = self.path_for(key, suffix)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # Write to a private name first so readers never see a partial entry
+            temp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+            link_or_copy(source_path, temp_path)
+            self._replace_entry(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not store cache entry {key}: {e}")
+            return None
+
+        self.evict()
+        return path
+
+    def put_bytes(self, key, data, suffix=''):
+        """Store data under key and return the cached path"""
+        if not self.enabled:
+            return None
+
+        path = self.path_for(key, suffix)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # Write to a private name first so readers never see a partial entry
+            temp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            self._replace_entry(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not store cache entry {key}: {e}")
+            return None
+
+        self.evict()
+        return path
+
+    def _replace_entry(self, temp_path, path):
+        """Move a written entry into place, keeping the running byte total"""
+        replaced_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+        added_bytes = os.path.getsize(temp_path)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += added_bytes - replaced_bytes
+
+    def _scan(self):
+        """(modification time, size, path) of every entry, and their total size"""
+        entries = []
+        total_bytes = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_bytes += stat.st_size
+        return entries, total_bytes
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its byte budget"""
+        with self._lock:
+            if self._total_bytes is None:
+                # First use: size up what earlier runs left behind
+                _, self._total_bytes = self._scan()
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            # Over budget: rescan for LRU order (also picks up other processes' entries)
+            entries, total_bytes = self._scan()
+            target_bytes = int(self.max_bytes * EVICT_TARGET)
+            for _, size, path in sorted(entries):
+                if total_bytes <= target_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total_bytes -= size
+                except OSError:
+                    continue
+            self._total_bytes = total_bytes
+
+    def stats(self):
+        """Hit/miss counters for this process"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
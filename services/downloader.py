@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DOWNLOAD_TIMEOUT = 10  # Seconds to connect and between received bytes, per request
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def get_download_workers():
+    """Concurrent downloads across all hosts (DOWNLOAD_WORKERS env var, defaults to 8)"""
+    try:
+        workers = int(os.getenv('DOWNLOAD_WORKERS', 8))
+    except ValueError:
+        workers = 8
+    return max(1, workers)
+
+def get_per_host_limit():
+    """Concurrent downloads from a single host (DOWNLOAD_PER_HOST env var, defaults to 4)"""
+    try:
+        limit = int(os.getenv('DOWNLOAD_PER_HOST', 4))
+    except ValueError:
+        limit = 4
+    return max(1, limit)
+
+def get_download_deadline():
+    """Seconds a whole batch of downloads may take (DOWNLOAD_DEADLINE env var, defaults to 60)"""
+    try:
+        deadline = float(os.getenv('DOWNLOAD_DEADLINE', 60))
+    except ValueError:
+        deadline = 60.0
+    return max(1.0, deadline)
+
+class Downloader:
+    """
+    Downloads files over one keep-alive session per host
+
+    Each host gets its own requests session with a connection pool sized to the per-host
+    limit, and a semaphore holds concurrent requests to that limit, so a batch reuses
+    connections (and TLS sessions) instead of opening one per file.
+    """
+
+    def __init__(self, per_host=None, timeout=DOWNLOAD_TIMEOUT):
+        self.per_host = per_host or get_per_host_limit()
+        self.timeout = timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+        # Held while a finished download is moved into place, so cancelling can't interleave
+        self._save_lock = threading.Lock()
+
+    def _host(self, url):
+        """The (session, semaphore) pair for url's host"""
+        parts = urlsplit(url)
+        host = (parts.scheme, parts.netloc)
+        with self._lock:
+            if host not in self._hosts:
+                http_session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host)
+                http_session.mount(f'{parts.scheme}://', adapter)
+                self._hosts[host] = (http_session, threading.BoundedSemaphore(self.per_host))
+            return self._hosts[host]
+
+    def fetch(self, url, save_path, cancelled=None):
+        """
+        Download url into save_path
+
+        Args:
+            cancelled: Optional threading.Event; once set, the download stops and nothing is saved
+
+        Returns:
+            bool: True if the file was saved
+        """
+        http_session, semaphore = self._host(url)
+        # Write to a private name first so a partial download never looks like an image
+        temp_path = f'{save_path}.{uuid.uuid4().hex[:8]}.tmp'
+        try:
+            with semaphore:
+                if cancelled is not None and cancelled.is_set():
+                    return False
+                with http_session.get(url, timeout=self.timeout, stream=True) as response:
+                    response.raise_for_status()
+                    with open(temp_path, 'wb') as f:
+                        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            if cancelled is not None and cancelled.is_set():
+                                return False
+                            f.write(chunk)
+            with self._save_lock:
+                if cancelled is not None and cancelled.is_set():
+                    return False
+                os.replace(temp_path, save_path)
+            return True
+        except Exception as e:
+            logging.warning(f"Download of {url} failed: {e}")
+            return False
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def download_all(self, jobs, workers=None, deadline=None):
+        """
+        Download (key, url, save_path) jobs on a bounded thread pool
+
+        Args:
+            workers: Concurrent downloads across all hosts (defaults to get_download_workers())
+            deadline: Seconds the whole batch may take (defaults to get_download_deadline());
+                downloads still running or queued when it passes count as failed, and
+                nothing is saved for them
+
+        Returns:
+            dict: key -> True if its file was saved
+        """
+        results = {key: False for key, _, _ in jobs}
+        if not jobs:
+            return results
+
+        workers = min(workers or get_download_workers(), len(jobs))
+        deadline = deadline or get_download_deadline()
+        cancelled = threading.Event()
+        start = time.monotonic()
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download')
+        try:
+            futures = {executor.submit(self.fetch, url, save_path, cancelled): key for key, url, save_path in jobs}
+            pending = set(futures)
+            while pending:
+                remaining = deadline - (time.monotonic() - start)
+                if remaining <= 0:
+                    logging.warning(f"Download deadline of {deadline}s passed with {len(pending)} downloads unfinished")
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures[future]] = future.result()
+        finally:
+            # Stop in-flight downloads at their next chunk and drop the queued ones; once the
+            # event is set, no download can still move a file into place
+            with self._save_lock:
+                cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # Downloads saved just before the deadline, whose results weren't collected in time
+        for key, _, save_path in jobs:
+            if not results[key] and os.path.exists(save_path):
+                results[key] = True
+
+        succeeded = sum(results.values())
+        logging.info(f"Downloaded {succeeded}/{len(jobs)} files in {time.monotonic() - start:.1f}s "
+                     f"({workers} workers, {self.per_host} per host)")
+        return results
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+def get_downloader():
+    """The process-wide downloader, so keep-alive connections outlive a single fetch"""
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader()
+        return _downloader
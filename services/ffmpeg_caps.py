@@ -0,0 +1,112 @@
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from PIL import Image
+
+# Encoders and filters the render pipeline relies on
+REQUIRED_ENCODERS = ('libx264', 'aac')
+# Audio is laid out in NumPy and piped in as PCM (see audio_timeline), so no audio filters
+REQUIRED_FILTERS = ('scale', 'pad', 'setsar', 'fps', 'format', 'trim', 'setpts', 'select', 'loop', 'split', 'concat',
+                    'color')
+
+_capabilities = None
+_capabilities_lock = threading.Lock()
+
+def parse_encoders(output):
+    """Encoder names from `ffmpeg -encoders` output"""
+    return {match.group(1) for match in re.finditer(r'^ [VAS][A-Z.]{5} (\S+)', output, re.MULTILINE)}
+
+def parse_filters(output):
+    """Filter names from `ffmpeg -filters` output"""
+    return {match.group(1) for match in re.finditer(r'^ [A-Z.]{2,3} (\S+)\s+\S*->\S*', output, re.MULTILINE)}
+
+def probe_stream_loop():
+    """
+    Check that -stream_loop really replays a GIF
+
+    Some builds accept the option but cannot seek back in the GIF demuxer, so this decodes a
+    two-frame GIF looped twice and counts the frames instead of trusting the option list.
+    """
+    temp_gif = tempfile.NamedTemporaryFile(suffix='.gif', delete=False)
+    temp_gif.close()
+    try:
+        frames = [Image.new('RGB', (16, 16), color) for color in ((0, 0, 0), (255, 255, 255))]
+        frames[0].save(temp_gif.name, save_all=True, append_images=frames[1:], duration=100, loop=0)
+
+        result = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-v', 'error', '-stream_loop', '2', '-i', temp_gif.name,
+             '-map', '0:v', '-f', 'framemd5', '-'],
+            capture_output=True, text=True, timeout=30
+        )
+        decoded_frames = [line for line in result.stdout.splitlines() if line and not line.startswith('#')]
+        return result.returncode == 0 and len(decoded_frames) > len(frames)
+    except Exception:
+        return False
+    finally:
+        os.unlink(temp_gif.name)
+
+def probe_ffmpeg_capabilities():
+    """Run FFmpeg to find its version, -stream_loop support and available encoders and filters"""
+    capabilities = {
+        'available': False,
+        'version': None,
+        'stream_loop': False,
+        'encoders': set(),
+        'filters': set(),
+    }
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-version'], capture_output=True, text=True, timeout=30)
+        if result.returncode != 0:
+            return capabilities
+        match = re.search(r'ffmpeg version (\S+)', result.stdout)
+        capabilities['version'] = match.group(1) if match else 'unknown'
+        capabilities['available'] = True
+
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=30)
+        capabilities['encoders'] = parse_encoders(result.stdout)
+
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-filters'], capture_output=True, text=True, timeout=30)
+        capabilities['filters'] = parse_filters(result.stdout)
+
+        capabilities['stream_loop'] = probe_stream_loop()
+    except (OSError, subprocess.SubprocessError) as e:
+        logging.error(f"Could not probe FFmpeg capabilities: {e}")
+
+    return capabilities
+
+def get_ffmpeg_capabilities():
+    """FFmpeg capabilities, probed once per process"""
+    global _capabilities
+    with _capabilities_lock:
+        if _capabilities is None:
+            _capabilities = probe_ffmpeg_capabilities()
+
+            missing = missing_requirements(_capabilities)
+            if not _capabilities['available']:
+                logging.error("FFmpeg not found; video generation will fail")
+            elif missing:
+                logging.warning(f"FFmpeg {_capabilities['version']} is missing: {', '.join(missing)}")
+            else:
+                logging.info(f"FFmpeg {_capabilities['version']} detected "
+                             f"(stream_loop: {_capabilities['stream_loop']})")
+        return _capabilities
+
+def missing_requirements(capabilities):
+    """Required encoders and filters this FFmpeg lacks"""
+    return ([f'encoder {name}' for name in REQUIRED_ENCODERS if name not in capabilities['encoders']] +
+            [f'filter {name}' for name in REQUIRED_FILTERS if name not in capabilities['filters']])
+
+def capabilities_summary():
+    """JSON-friendly view of the capabilities the render pipeline depends on"""
+    capabilities = get_ffmpeg_capabilities()
+    return {
+        'available': capabilities['available'],
+        'version': capabilities['version'],
+        'stream_loop': capabilities['stream_loop'],
+        'encoders': {name: name in capabilities['encoders'] for name in REQUIRED_ENCODERS},
+        'filters': {name: name in capabilities['filters'] for name in REQUIRED_FILTERS},
+        'missing': missing_requirements(capabilities),
+    }
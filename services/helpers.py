@@ -1,9 +1,9 @@
 from functools import wraps
 from flask import session, redirect, url_for
 from models import Configuration, Meme, db
-import requests
 import os
 import uuid
+import logging
 
 def require_login(f):
     """Decorator to require user login for routes"""
@@ -25,23 +25,11 @@ def get_user_config(user_id):
 
 def download_image(url, save_path):
     """Download image from URL and save locally"""
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
-        return True
-    except Exception:
-        return False
-
-def save_meme_to_db(user_id, url, text="", subreddit="memes"):
-    """Save meme to database and download image locally"""
-    # Check for existing meme with same URL to prevent duplicates
-    existing_meme = Meme.query.filter_by(user_id=user_id, url=url).first()
-    if existing_meme:
-        return existing_meme
+    from services.downloader import get_downloader
+    return get_downloader().fetch(url, save_path)
 
+def new_image_path(url):
+    """Unique local path for a meme image downloaded from url"""
     # Create unique filename for the image
     file_extension = url.split('.')[-1].lower()
     if file_extension not in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
@@ -52,18 +40,126 @@ def save_meme_to_db(user_id, url, text="", subreddit="memes"):
 
     # Ensure images directory exists
     os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    return image_path
 
-    # Download image
-    image_downloaded = download_image(url, image_path)
+def add_meme(user_id, url, image_path, text="", subreddit="memes"):
+    """Add a meme whose image is already downloaded (image_path None if it failed) to the session
 
-    # Save meme to database
+    The caller commits, then passes the new ids to schedule_gif_loops so GIFs are transcoded
+    in the background rather than during ingest.
+    """
     meme = Meme(
         user_id=user_id,
         url=url,
         text=text,
         subreddit=subreddit,
-        image_path=image_path if image_downloaded else None
+        image_path=image_path
     )
     db.session.add(meme)
+    return meme
+
+def save_meme_to_db(user_id, url, text="", subreddit="memes"):
+    """Save meme to database and download image locally"""
+    # Check for existing meme with same URL to prevent duplicates
+    existing_meme = Meme.query.filter_by(user_id=user_id, url=url).first()
+    if existing_meme:
+        return existing_meme
+
+    image_path = new_image_path(url)
+
+    # Download image
+    image_downloaded = download_image(url, image_path)
+
+    # Save meme to database
+    meme = add_meme(user_id, url, image_path if image_downloaded else None, text, subreddit)
     db.session.commit()
+
+    # Transcode GIFs once in the background so renders never have to demux the GIF
+    from services.prerender import schedule_gif_loops
+    schedule_gif_loops([meme.id])
     return meme
+
+def update_media_durations(meme):
+    """Probe and store audio/GIF durations on a meme (caller commits)"""
+    from services.video_service import get_audio_duration, get_gif_duration, is_gif
+
+    if meme.audio_path and os.path.exists(meme.audio_path):
+        meme.audio_duration = get_audio_duration(meme.audio_path)
+    else:
+        meme.audio_duration = None
+
+    if meme.image_path and is_gif(meme.image_path) and os.path.exists(meme.image_path):
+        if meme.gif_duration is None:
+            meme.gif_duration = get_gif_duration(meme.image_path)
+
+def prepare_gif_loop(meme):
+    """Create a GIF meme's loop intermediate and record its natural loop duration (caller commits)
+
+    Returns:
+        bool: True if the meme was changed
+    """
+    from services.video_service import get_gif_duration, is_gif, transcode_gif_loop
+
+    if not meme.image_path or not is_gif(meme.image_path) or not os.path.exists(meme.image_path):
+        return False
+    if meme.loop_video_path and os.path.exists(meme.loop_video_path) and meme.gif_duration is not None:
+        return False
+
+    if meme.gif_duration is None:
+        meme.gif_duration = get_gif_duration(meme.image_path)
+
+    loop_video_path = os.path.splitext(meme.image_path)[0] + '_loop.mp4'
+    if transcode_gif_loop(meme.image_path, loop_video_path):
+        meme.loop_video_path = loop_video_path
+    else:
+        # Renders fall back to looping the GIF itself
+        meme.loop_video_path = None
+    return True
+
+def audio_preview_path(audio_path):
+    """Where the compact browser preview of a generated audio file lives"""
+    return os.path.splitext(audio_path)[0] + '.m4a'
+
+def remove_audio_files(audio_path):
+    """Delete a generated audio file and its browser preview, ignoring files already gone"""
+    for path in (audio_path, audio_preview_path(audio_path)):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception:
+            pass  # Ignore file deletion errors
+
+def get_meme_duration(meme, audio_path=None):
+    """Content duration of a meme in seconds - stored audio duration, or 3s for memes without audio"""
+    from services.video_service import get_audio_duration
+
+    audio_path = audio_path or meme.audio_path
+    if not audio_path or not os.path.exists(audio_path):
+        return 3.0
+
+    if audio_path != meme.audio_path:
+        # Audio only known to the session, so there is nothing to store it against
+        return get_audio_duration(audio_path)
+
+    if meme.audio_duration is None:
+        # Audio created before durations were stored
+        update_media_durations(meme)
+        db.session.commit()
+    return meme.audio_duration
+
+def backfill_media_durations():
+    """Fill duration columns for memes created before they were stored"""
+    memes = Meme.query.filter(
+        db.or_(
+            db.and_(Meme.audio_path != None, Meme.audio_duration == None),
+            db.and_(Meme.image_path.ilike('%.gif'), Meme.gif_duration == None)
+        )
+    ).all()
+
+    for meme in memes:
+        update_media_durations(meme)
+
+    if memes:
+        db.session.commit()
+        logging.info(f"Backfilled media durations for {len(memes)} memes")
+    return len(memes)
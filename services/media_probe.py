@@ -0,0 +1,106 @@
+import os
+import struct
+from PIL import Image, ImageSequence
+
+# FFmpeg's GIF demuxer treats delays below 20ms as 100ms, so mirror it to match ffprobe
+GIF_MIN_FRAME_DELAY_MS = 20
+GIF_DEFAULT_FRAME_DELAY_MS = 100
+
+# WAVE format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def parse_wav_header(wav_path):
+    """
+    Read the format and data location of a RIFF/WAVE file, or None if it can't be parsed
+
+    Returns:
+        dict: format_tag, channels, sample_rate, byte_rate, block_align, bits_per_sample,
+            data_offset and data_size (in bytes)
+    """
+    try:
+        with open(wav_path, 'rb') as f:
+            riff_header = f.read(12)
+            if len(riff_header) < 12 or riff_header[:4] != b'RIFF' or riff_header[8:12] != b'WAVE':
+                return None
+
+            header = None
+            while True:
+                chunk_header = f.read(8)
+                if len(chunk_header) < 8:
+                    return None
+                chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size)
+                    if len(fmt) < 16:
+                        return None
+                    # WAVEFORMATEX: format tag, channels, sample rate, byte rate, block align, bits
+                    format_tag, channels, sample_rate, byte_rate, block_align, bits_per_sample = \
+                        struct.unpack('<HHIIHH', fmt[:16])
+                    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                        # The real format tag leads the subformat GUID
+                        format_tag = struct.unpack('<H', fmt[24:26])[0]
+                    header = {
+                        'format_tag': format_tag,
+                        'channels': channels,
+                        'sample_rate': sample_rate,
+                        'byte_rate': byte_rate,
+                        'block_align': block_align,
+                        'bits_per_sample': bits_per_sample,
+                    }
+                    if chunk_size % 2:
+                        f.seek(1, os.SEEK_CUR)
+                elif chunk_id == b'data':
+                    if not header or not header['byte_rate']:
+                        return None
+                    # Streaming writers leave the size unset; fall back to the bytes on disk
+                    remaining = os.path.getsize(wav_path) - f.tell()
+                    if chunk_size in (0, 0xFFFFFFFF) or chunk_size > remaining:
+                        chunk_size = remaining
+                    header['data_offset'] = f.tell()
+                    header['data_size'] = chunk_size
+                    return header
+                else:
+                    f.seek(chunk_size + (chunk_size % 2), os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+def probe_wav_duration(wav_path):
+    """Read the duration of a RIFF/WAVE file from its header, or None if it can't be parsed"""
+    header = parse_wav_header(wav_path)
+    if not header:
+        return None
+    return header['data_size'] / header['byte_rate']
+
+def probe_gif_duration(gif_path):
+    """Sum the frame delays of a GIF with Pillow, or None if it can't be parsed"""
+    try:
+        with Image.open(gif_path) as img:
+            if img.format != 'GIF':
+                return None
+
+            total_ms = 0
+            for frame in ImageSequence.Iterator(img):
+                delay = frame.info.get('duration', 0)
+                if delay < GIF_MIN_FRAME_DELAY_MS:
+                    delay = GIF_DEFAULT_FRAME_DELAY_MS
+                total_ms += delay
+            return total_ms / 1000.0
+    except Exception:
+        return None
+
+def probe_media_duration(media_path):
+    """Duration of a WAV or GIF read in-process, or None for containers that need ffprobe"""
+    try:
+        with open(media_path, 'rb') as f:
+            magic = f.read(12)
+    except OSError:
+        return None
+
+    if magic[:4] == b'RIFF' and magic[8:12] == b'WAVE':
+        return probe_wav_duration(media_path)
+    if magic[:6] in (b'GIF87a', b'GIF89a'):
+        return probe_gif_duration(media_path)
+    return None
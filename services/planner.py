@@ -0,0 +1,87 @@
+# (min, max) total duration in seconds for each video type
+VIDEO_DURATION_LIMITS = {
+    'regular': (600, 660),  # 10-11 minutes
+    'shorts': (60, 180),    # 1-3 minutes
+}
+
+# Every meme is shown with a 1s gap before and after it
+GAP_DURATION = 1.0
+
+def meme_span(meme_data):
+    """Seconds a meme takes up in a compilation, including its gaps"""
+    return GAP_DURATION + meme_data.get('duration', 3.0) + GAP_DURATION
+
+def pack_into_bins(memes, bin_count, min_duration, max_duration):
+    """
+    Distribute memes over bin_count compilations, each between min and max duration
+
+    Longest memes are placed first, each into the currently shortest compilation it still
+    fits in, which keeps the compilations balanced. Memes that fit nowhere are left out.
+
+    Returns:
+        list or None: Lists of memes per compilation, or None if any compilation falls short
+    """
+    bins = [[] for _ in range(bin_count)]
+    totals = [0.0] * bin_count
+
+    for meme_data in sorted(memes, key=meme_span, reverse=True):
+        span = meme_span(meme_data)
+        candidates = [i for i in range(bin_count) if totals[i] + span <= max_duration]
+        if not candidates:
+            continue
+        target = min(candidates, key=lambda i: totals[i])
+        bins[target].append(meme_data)
+        totals[target] += span
+
+    if any(total < min_duration for total in totals):
+        return None
+    return bins
+
+def plan_compilations(memes_data, video_type):
+    """
+    Pack available memes into as many valid compilations of a video type as possible
+
+    Older memes (earlier in memes_data) are preferred when not everything fits, and each
+    plan keeps the memes in their original order.
+
+    Returns:
+        list: Plans, each a list of meme dicts, in the order they should be rendered
+    """
+    min_duration, max_duration = VIDEO_DURATION_LIMITS[video_type]
+    total_duration = sum(meme_span(meme_data) for meme_data in memes_data)
+    order = {id(meme_data): index for index, meme_data in enumerate(memes_data)}
+
+    for bin_count in range(int(total_duration // min_duration), 0, -1):
+        # Oldest memes that could fill this many compilations
+        pool = []
+        pool_duration = 0.0
+        for meme_data in memes_data:
+            if pool_duration + meme_span(meme_data) > bin_count * max_duration:
+                break
+            pool.append(meme_data)
+            pool_duration += meme_span(meme_data)
+
+        bins = pack_into_bins(pool, bin_count, min_duration, max_duration)
+        if bins:
+            plans = [sorted(plan, key=lambda meme_data: order[id(meme_data)]) for plan in bins]
+            plans.sort(key=lambda plan: order[id(plan[0])])
+            return plans
+
+    return []
+
+def shorts_prefix(plan):
+    """
+    Number of a regular plan's leading memes that also make a valid short, or 0
+
+    Lets a short be rendered from the same decode as its regular video. The leading memes
+    must all still be available for shorts.
+    """
+    min_duration, max_duration = VIDEO_DURATION_LIMITS['shorts']
+    count = 0
+    total_duration = 0.0
+    for meme_data in plan:
+        if meme_data.get('used_in_shorts_video') or total_duration + meme_span(meme_data) > max_duration:
+            break
+        count += 1
+        total_duration += meme_span(meme_data)
+    return count if total_duration >= min_duration else 0
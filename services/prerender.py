@@ -0,0 +1,143 @@
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+from models import Meme, db
+from services.helpers import get_user_config, prepare_gif_loop
+
+_queue = queue.Queue()
+_pending = set()
+_pending_lock = threading.Lock()
+_worker_thread = None
+_worker_lock = threading.Lock()
+
+def prerender_enabled():
+    """Whether ready memes get their segments encoded ahead of time (PRERENDER env var, defaults to on)"""
+    return os.getenv('PRERENDER', '1') != '0'
+
+def _schedule(task, meme_ids):
+    """Queue (task, meme_id) work for the background worker, skipping work already queued"""
+    with _pending_lock:
+        for meme_id in meme_ids:
+            if (task, meme_id) not in _pending:
+                _pending.add((task, meme_id))
+                _queue.put((task, meme_id))
+
+def schedule_prerender(meme_ids):
+    """Queue memes whose content just became final for segment pre-rendering"""
+    if not prerender_enabled():
+        return
+    _schedule('segments', meme_ids)
+
+def schedule_gif_loops(meme_ids):
+    """Queue newly ingested memes for their GIF loop intermediates (see prepare_gif_loop)"""
+    _schedule('gif_loop', meme_ids)
+
+def prerender_meme(meme):
+    """
+    Encode a ready meme's segments into the segment cache for each enabled aspect ratio
+
+    Uses the same segment jobs and cache keys as render_segmented_video, at the user's
+    default encode profile, so a later compilation only has to concatenate them.
+
+    Returns:
+        int: Segments now in the cache
+    """
+    from services.render_jobs import meme_render_data
+    from services.video_service import (get_segment_cache, get_video_dimensions, meme_segment_jobs,
+                                        render_cached_segment)
+
+    if not get_segment_cache().enabled:
+        return 0
+
+    meme_data = meme_render_data(meme)
+    # Commit a GIF loop intermediate made for the meme
+    if db.session.dirty:
+        db.session.commit()
+    if not meme_data:
+        return 0
+
+    config = get_user_config(meme.user_id)
+    profile = config.encode_profile
+    video_types = [
+        video_type for video_type, enabled in (('regular', config.create_videos), ('shorts', config.create_shorts))
+        if enabled and not meme_data[f'used_in_{video_type}_video']
+    ]
+
+    cached = 0
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for video_type in video_types:
+            video_width, video_height = get_video_dimensions(video_type, profile)
+            # The gap after shares the gap before's cache entry, so two encodes cover all three
+            jobs = meme_segment_jobs(meme_data, temp_dir, 0, video_width, video_height, profile)[:2]
+            for output_path, _, function, args, key_parts, _ in jobs:
+                # A single FFmpeg thread keeps speculative work from crowding out real renders
+                if render_cached_segment(key_parts, output_path, function, args, threads=1, profile=profile):
+                    cached += 1
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return cached
+
+def run_task(task, meme_id):
+    """Do one queued piece of background work for a meme"""
+    meme = db.session.get(Meme, meme_id)
+    if not meme or meme.discarded:
+        return
+
+    if task == 'gif_loop':
+        # Renders fall back to preparing the loop themselves if this hasn't run yet
+        if prepare_gif_loop(meme):
+            db.session.commit()
+            logging.info(f"Prepared GIF loop for meme {meme_id}")
+    elif meme.audio_approved:
+        # Content may have changed since it was queued
+        cached = prerender_meme(meme)
+        logging.info(f"Pre-rendered meme {meme_id}: {cached} segments cached")
+
+def pending_memes():
+    """Ids of ready memes not yet used in every video, e.g. to pre-render after a restart"""
+    memes = Meme.query.filter_by(
+        discarded=False,
+        text_approved=True,
+        audio_approved=True,
+        video_generated=False
+    ).order_by(Meme.created_at).all()
+    return [meme.id for meme in memes]
+
+def _worker_loop(app):
+    """Run queued background work one item at a time for the lifetime of the process"""
+    with app.app_context():
+        try:
+            schedule_prerender(pending_memes())
+        except Exception as e:
+            logging.error(f"Could not queue pending memes for pre-rendering: {e}")
+        finally:
+            db.session.remove()
+
+        while True:
+            task, meme_id = _queue.get()
+            try:
+                run_task(task, meme_id)
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Background {task} work for meme {meme_id} failed: {e}")
+            finally:
+                with _pending_lock:
+                    _pending.discard((task, meme_id))
+                db.session.remove()
+
+def start_prerender_worker(app):
+    """Start the background worker for this process (no-op if already running)
+
+    It prepares GIF loops for new memes, and pre-renders segments unless PRERENDER=0.
+    """
+    global _worker_thread
+    with _worker_lock:
+        if _worker_thread is not None and _worker_thread.is_alive():
+            return
+        _worker_thread = threading.Thread(target=_worker_loop, args=(app,), name='prerender-worker', daemon=True)
+        _worker_thread.start()
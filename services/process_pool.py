@@ -0,0 +1,85 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_started = False
+
+# Modules the forkserver imports once, so replacement workers don't each import the app
+FORKSERVER_PRELOAD = ['services.video_service', 'services.audio_service']
+
+def get_pool_workers():
+    """Number of long-lived worker processes (PROCESS_WORKERS env var, defaults to CPU count; 1 keeps all work in-process)"""
+    cpu_count = os.cpu_count() or 1
+    try:
+        workers = int(os.getenv('PROCESS_WORKERS', cpu_count))
+    except ValueError:
+        workers = cpu_count
+    return max(1, workers)
+
+def pool_context(restart):
+    """
+    Start method for a new pool, or None if worker processes can't be started safely
+
+    The first pool is forked at start-up, before the app's background threads exist. A
+    replacement for a pool that died is started from the running, multi-threaded server,
+    so its workers come from a forkserver instead of a fork of this process.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if not restart and 'fork' in methods:
+        return multiprocessing.get_context('fork')
+    if 'forkserver' in methods:
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(FORKSERVER_PRELOAD)
+        return context
+    return None
+
+def get_process_pool():
+    """
+    The process-wide pool for CPU-bound stages (image preparation, speech synthesis)
+
+    Workers are started once, all together, and reused for the life of the process rather
+    than forked per render from a busy multi-threaded process (see pool_context). Where
+    worker processes aren't available, or only one worker is configured, this returns None
+    and callers do the work in-process.
+    """
+    global _pool, _pool_started
+    workers = get_pool_workers()
+    if workers < 2:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            context = pool_context(restart=_pool_started)
+            if context is None:
+                return None
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_started = True
+            try:
+                # A fork-context pool launches every worker on the first submit, so do it now
+                pool.submit(os.getpid).result()
+            except Exception as e:
+                logging.warning(f"Could not start worker processes, working in-process: {e}")
+                pool.shutdown(wait=False, cancel_futures=True)
+                return None
+            _pool = pool
+            logging.info(f"Started {workers} worker processes ({context.get_start_method()})")
+        return _pool
+
+def start_process_pool():
+    """Fork the worker processes up front, before the app starts its background threads"""
+    try:
+        get_process_pool()
+    except Exception as e:
+        logging.warning(f"Could not start worker processes: {e}")
+
+def discard_process_pool(pool):
+    """Drop a pool whose workers died, so the next get_process_pool() starts a replacement"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,480 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from models import Meme, GeneratedVideo, RenderJob, db
+from services.helpers import get_user_config, get_meme_duration, prepare_gif_loop
+from services.planner import VIDEO_DURATION_LIMITS, meme_span, plan_compilations, shorts_prefix
+from services.render_progress import publish_progress
+
+# Seconds between checks for new jobs when the worker hasn't been woken up
+WORKER_POLL_INTERVAL = 5
+
+# Seconds between progress updates from the job's thread while compilations render
+PROGRESS_INTERVAL = 2
+
+# Preview proxies are throwaway; remove them after a day
+PREVIEW_MAX_AGE = 24 * 60 * 60
+
+_worker_thread = None
+_worker_lock = threading.Lock()
+_wake_event = threading.Event()
+
+def meme_render_data(meme):
+    """
+    The data the renderer needs for a ready meme, or None if its image is missing
+
+    GIFs ingested before loop intermediates existed get one here, which the caller commits.
+    """
+    # Verify image path exists
+    if not meme.image_path or not os.path.exists(meme.image_path):
+        logging.error(f"Image not found for meme {meme.id}: {meme.image_path}")
+        return None
+
+    prepare_gif_loop(meme)
+
+    audio_path = meme.audio_path
+    if audio_path and os.path.exists(audio_path):
+        duration = get_meme_duration(meme)
+        logging.info(f"Meme {meme.id}: audio duration {duration}s")
+    else:
+        duration = 3.0  # Default for memes without audio
+        audio_path = None
+        logging.info(f"Meme {meme.id}: no audio, using default 3s duration")
+
+    return {
+        'meme_id': meme.id,
+        'image_path': meme.image_path,
+        'audio_path': audio_path,
+        'duration': duration,
+        'gif_duration': meme.gif_duration,
+        'loop_video_path': meme.loop_video_path,
+        'used_in_regular_video': meme.used_in_regular_video,
+        'used_in_shorts_video': meme.used_in_shorts_video
+    }
+
+def collect_ready_memes(user_id):
+    """Get memes ready for video generation and the data the renderer needs for them"""
+    ready_memes = Meme.query.filter_by(
+        user_id=user_id,
+        discarded=False,
+        text_approved=True,
+        audio_approved=True
+    ).order_by(Meme.created_at).all()
+
+    memes_data = []
+    for meme in ready_memes:
+        meme_data = meme_render_data(meme)
+        if meme_data:
+            memes_data.append(meme_data)
+
+    # Commit GIF loop intermediates made along the way
+    if db.session.dirty:
+        db.session.commit()
+
+    return ready_memes, memes_data
+
+def prune_previews(max_age=PREVIEW_MAX_AGE):
+    """Delete preview proxies older than max_age seconds"""
+    from services.video_service import PREVIEW_OUTPUT_DIR
+
+    if not os.path.isdir(PREVIEW_OUTPUT_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(PREVIEW_OUTPUT_DIR):
+        path = os.path.join(PREVIEW_OUTPUT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def get_plan_workers():
+    """Number of compilations rendered concurrently (PLAN_WORKERS env var, defaults to 2)"""
+    try:
+        workers = int(os.getenv('PLAN_WORKERS', 2))
+    except ValueError:
+        workers = 2
+    return max(1, workers)
+
+def plan_video_type(available_memes, video_type):
+    """
+    Plans for one video type, falling back to a single short of whatever is available
+
+    Shorts under the one-minute minimum were always rendered from what there is, so that
+    stays possible when the planner finds no valid packing.
+    """
+    plans = plan_compilations(available_memes, video_type)
+    if plans or video_type != 'shorts':
+        return plans
+
+    _, max_duration = VIDEO_DURATION_LIMITS[video_type]
+    plan = []
+    total_duration = 0.0
+    for meme_data in available_memes:
+        if total_duration + meme_span(meme_data) > max_duration:
+            break
+        plan.append(meme_data)
+        total_duration += meme_span(meme_data)
+    return [plan] if plan else []
+
+def render_plan(plan, video_type, **kwargs):
+    """Render one planned compilation, returning [(video_type, result)] like generate_dual_compilation"""
+    from services.video_service import generate_compilation_video
+
+    result = generate_compilation_video(plan, video_type, VIDEO_DURATION_LIMITS[video_type][0],
+                                        preselected=True, **kwargs)
+    return [(video_type, result)]
+
+def run_video_generation(user_id, requested_type=None, engine='segments', progress_callback=None,
+                         profile=None, preview=False, meme_ids=None):
+    """
+    Generate compilation videos based on user settings
+
+    Available memes are packed into as many compilations per video type as the duration
+    limits allow, and up to PLAN_WORKERS of them are rendered at once.
+
+    Args:
+        user_id: Owner of the memes and videos
+        requested_type: 'regular', 'shorts' or None for every enabled type
+        engine: Render engine passed to generate_compilation_video
+        profile: Encode profile name, defaulting to the user's configured profile
+        progress_callback: Optional callable(stage, percent, detail=None) for overall progress,
+            possibly called from render worker threads
+        preview: Render low-resolution proxies instead; they are not saved as generated
+            videos and don't mark memes as used
+        meme_ids: Exact meme selection and order to render as a single compilation (e.g. from
+            a preview) instead of planning compilations
+
+    Returns:
+        tuple: (videos_generated, errors, previews) - human-readable descriptions, plus a
+            dict per preview proxy with its video_type, video_path, duration and meme_ids
+    """
+    from services.video_service import generate_dual_compilation, PREVIEW_PROFILE, PREVIEW_OUTPUT_DIR
+
+    config = get_user_config(user_id)
+    profile = PREVIEW_PROFILE if preview else profile or config.encode_profile
+
+    logging.info(f"Starting video generation for user {user_id}")
+    logging.info(f"Config: create_videos={config.create_videos}, create_shorts={config.create_shorts}")
+    logging.info(f"Requested type: {requested_type}, engine: {engine}, profile: {profile}, preview: {preview}")
+
+    ready_memes, memes_data = collect_ready_memes(user_id)
+    logging.info(f"Found {len(ready_memes)} ready memes, prepared {len(memes_data)} for video generation")
+
+    if not ready_memes:
+        return [], ['No memes ready for video generation.'], []
+    if not memes_data:
+        return [], ['No valid memes found for video generation.'], []
+
+    if preview:
+        prune_previews()
+
+    # Video types to render, with their error messages
+    video_types = []
+    if config.create_videos and (not requested_type or requested_type == 'regular'):
+        video_types.append(('regular', 'Insufficient content for 10-minute regular video',
+                            'No memes available for regular video (all already used)'))
+    if config.create_shorts and (not requested_type or requested_type == 'shorts'):
+        video_types.append(('shorts', 'No content available for shorts video',
+                            'No memes available for shorts (all already used)'))
+
+    videos_generated = []
+    errors = []
+    previews = []
+
+    # Shorts made from the start of a regular video come out of the same render; that shared
+    # decode is the single-pass engine, so other engines keep rendering each type on its own
+    dual_output = bool(config.dual_output and not meme_ids and engine == 'filtergraph' and
+                       {'regular', 'shorts'} <= {video_type for video_type, _, _ in video_types})
+
+    # (video_type, memes, shorts_count) for every render; video_type 'dual' renders a regular
+    # video plus a short of its first shorts_count memes
+    plans = []
+    paired_ids = set()
+    for video_type, plan_error, empty_error in video_types:
+        used_flag = f'used_in_{video_type}_video'
+
+        # Filter memes that haven't been used in this video type or already paired into a short
+        available_memes = [m for m in memes_data if not m[used_flag] and m['meme_id'] not in paired_ids]
+        logging.info(f"{video_type} videos enabled. Total memes_data: {len(memes_data)}, Available: {len(available_memes)}")
+
+        if meme_ids:
+            # Render exactly the requested selection, in order, if all of it is still available
+            available_by_id = {m['meme_id']: m for m in available_memes}
+            if not all(meme_id in available_by_id for meme_id in meme_ids):
+                errors.append(f'Some previewed memes are no longer available for {video_type} video')
+                continue
+            plans.append((video_type, [available_by_id[meme_id] for meme_id in meme_ids], 0))
+            continue
+
+        if not available_memes:
+            if not paired_ids:
+                errors.append(empty_error)
+            continue
+
+        if paired_ids:
+            # Shorts were already cut from regular videos, so don't add an under-length one
+            type_plans = plan_compilations(available_memes, video_type)
+        else:
+            type_plans = plan_video_type(available_memes, video_type)
+            if not type_plans:
+                errors.append(plan_error)
+                continue
+
+        logging.info(f"Planned {len(type_plans)} {video_type} compilations from {len(available_memes)} memes: "
+                     f"{', '.join(f'{sum(meme_span(m) for m in plan):.0f}s' for plan in type_plans)}")
+
+        for plan in type_plans:
+            shorts_count = shorts_prefix(plan) if dual_output and video_type == 'regular' else 0
+            if shorts_count:
+                plans.append(('dual', plan, shorts_count))
+                paired_ids.update(meme_data['meme_id'] for meme_data in plan[:shorts_count])
+            else:
+                plans.append((video_type, plan, 0))
+
+    if not plans:
+        return videos_generated, errors, previews
+
+    # Overall progress is the mean of every compilation's progress
+    plan_progress = [0.0] * len(plans)
+    latest_stage = ['planning']
+    progress_lock = threading.Lock()
+
+    def make_report(index, video_type):
+        label = f'{video_type} {index + 1}/{len(plans)}' if len(plans) > 1 else video_type
+
+        def report(stage, fraction, detail=None):
+            if not progress_callback:
+                return
+            with progress_lock:
+                plan_progress[index] = fraction
+                latest_stage[0] = f'{label}: {stage}'
+                percent = 100.0 * sum(plan_progress) / len(plans)
+            progress_callback(latest_stage[0], percent, detail)
+        return report
+
+    output_dir = PREVIEW_OUTPUT_DIR if preview else 'static/videos'
+    preview_by_plan = {}
+    workers = min(get_plan_workers(), len(plans))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for index, (video_type, plan, shorts_count) in enumerate(plans):
+            report = make_report(index, 'regular + shorts' if video_type == 'dual' else video_type)
+            if video_type == 'dual':
+                future = executor.submit(
+                    generate_dual_compilation, plan, shorts_count, progress_callback=report, profile=profile,
+                    output_dir=output_dir
+                )
+            else:
+                future = executor.submit(
+                    render_plan, plan, video_type, engine=engine, progress_callback=report, profile=profile,
+                    output_dir=output_dir
+                )
+            futures[future] = index
+
+        # Results are recorded here, in the job's thread, which owns the database session
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            if progress_callback:
+                # Renders report from their own threads; repeat the latest state from this one
+                with progress_lock:
+                    stage, percent = latest_stage[0], 100.0 * sum(plan_progress) / len(plans)
+                progress_callback(stage, percent)
+            for future in done:
+                index = futures[future]
+                for position, (video_type, result) in enumerate(future.result()):
+                    success, video_path, actual_duration, memes_used, used_meme_ids = result
+
+                    if not success:
+                        errors.append(f'Failed to render {video_type} video')
+                        continue
+
+                    label = 'Shorts video' if video_type == 'shorts' else 'Regular video'
+
+                    if preview:
+                        # Previews leave the memes available; remember the selection so it can be promoted
+                        preview_by_plan[(index, position)] = {
+                            'video_type': video_type,
+                            'video_path': video_path,
+                            'duration': actual_duration,
+                            'meme_ids': used_meme_ids
+                        }
+                        videos_generated.append(f'{label} preview ({memes_used} memes, {actual_duration:.1f}s)')
+                        continue
+
+                    # Save video record
+                    video_record = GeneratedVideo(
+                        user_id=user_id,
+                        video_path=video_path,
+                        video_type=video_type,
+                        duration=actual_duration,
+                        memes_count=memes_used,
+                        meme_ids=json.dumps(used_meme_ids)
+                    )
+                    db.session.add(video_record)
+
+                    # Mark memes as used in this video type
+                    used_flag = f'used_in_{video_type}_video'
+                    for meme_id in used_meme_ids:
+                        meme = next(m for m in ready_memes if m.id == meme_id)
+                        setattr(meme, used_flag, True)
+                        # Update legacy field if used in all enabled types
+                        if (not config.create_videos or meme.used_in_regular_video) and \
+                                (not config.create_shorts or meme.used_in_shorts_video):
+                            meme.video_generated = True
+
+                    # Commit each compilation as it finishes so a later failure doesn't lose it
+                    db.session.commit()
+
+                    videos_generated.append(f'{label} ({memes_used} memes, {actual_duration:.1f}s)')
+
+    # Compilations finish in any order; list previews in plan order
+    previews = [preview_by_plan[key] for key in sorted(preview_by_plan)]
+    return videos_generated, errors, previews
+
+def summarize_generation(videos_generated, errors):
+    """Turn generation results into (success, message) for the user"""
+    if videos_generated and not errors:
+        return True, f"Generated: {', '.join(videos_generated)}"
+    elif videos_generated and errors:
+        return True, f"Generated: {', '.join(videos_generated)}. Errors: {', '.join(errors)}"
+    else:
+        return False, f"Failed to generate videos. Errors: {', '.join(errors)}"
+
+def enqueue_render_job(user_id, video_type=None, engine='segments', encode_profile='standard', preview=False,
+                       meme_ids=None):
+    """Queue a render job and wake the worker"""
+    job = RenderJob(user_id=user_id, video_type=video_type, engine=engine, encode_profile=encode_profile,
+                    preview=preview, meme_ids=json.dumps(meme_ids) if meme_ids else None,
+                    status='queued', progress=0.0)
+    db.session.add(job)
+    db.session.commit()
+
+    _wake_event.set()
+    return job
+
+def job_to_dict(job):
+    """Serialize a render job for the polling API"""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'video_type': job.video_type,
+        'engine': job.engine,
+        'encode_profile': job.encode_profile,
+        'preview': bool(job.preview),
+        'stage': job.stage,
+        'progress': round(job.progress or 0.0, 1),
+        'message': job.message,
+        'result': json.loads(job.result) if job.result else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def recover_interrupted_jobs():
+    """Re-queue jobs that were running when the app last stopped"""
+    interrupted = RenderJob.query.filter_by(status='running').all()
+    for job in interrupted:
+        job.status = 'queued'
+        job.stage = None
+        job.progress = 0.0
+    if interrupted:
+        db.session.commit()
+        logging.info(f"Re-queued {len(interrupted)} interrupted render jobs")
+
+def claim_next_job():
+    """Atomically move the next queued job to running, so concurrent workers never share a job
+
+    Previews take seconds and someone is waiting on them, so they go ahead of full renders.
+    """
+    job = RenderJob.query.filter_by(status='queued').order_by(
+        RenderJob.preview.desc(), RenderJob.created_at, RenderJob.id
+    ).first()
+    if not job:
+        return None
+
+    claimed = RenderJob.query.filter_by(id=job.id, status='queued').update(
+        {'status': 'running', 'started_at': db.func.current_timestamp(), 'stage': 'starting', 'progress': 0.0}
+    )
+    db.session.commit()
+    return db.session.get(RenderJob, job.id) if claimed else None
+
+def run_render_job(job):
+    """Execute a claimed job and record its outcome"""
+    job_id = job.id
+    worker_thread = threading.current_thread()
+    last_progress = [-1.0]
+
+    publish_progress(job_id, status='running', stage=job.stage, progress=0.0, detail={})
+
+    def update_progress(stage, percent, detail=None):
+        # Live progress goes to subscribers from any thread
+        publish_progress(job_id, status='running', stage=stage, progress=round(percent, 1), detail=detail or {})
+
+        # Only the worker thread owns the job's database session; skip sub-percent changes
+        if threading.current_thread() is worker_thread and \
+                (stage != job.stage or percent - last_progress[0] >= 1.0):
+            job.stage = stage
+            job.progress = percent
+            db.session.commit()
+            last_progress[0] = percent
+
+    try:
+        videos_generated, errors, previews = run_video_generation(
+            job.user_id, job.video_type, job.engine or 'segments', progress_callback=update_progress,
+            profile=job.encode_profile, preview=bool(job.preview),
+            meme_ids=json.loads(job.meme_ids) if job.meme_ids else None
+        )
+        success, message = summarize_generation(videos_generated, errors)
+        job.status = 'done' if success else 'failed'
+        job.message = message
+        job.result = json.dumps({'videos': videos_generated, 'errors': errors, 'previews': previews})
+        job.progress = 100.0 if success else job.progress
+        log = logging.info if success else logging.error
+        log(f"Render job {job.id} finished: {message}")
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Render job {job.id} crashed: {e}")
+        job.status = 'failed'
+        job.message = f'Error generating videos: {str(e)}'
+
+    job.stage = job.status
+    # Same UTC database clock as created_at
+    job.finished_at = db.func.current_timestamp()
+    db.session.commit()
+
+    publish_progress(job_id, status=job.status, stage=job.stage, progress=job.progress, message=job.message)
+
+def _worker_loop(app):
+    """Process queued render jobs one at a time for the lifetime of the process"""
+    with app.app_context():
+        recover_interrupted_jobs()
+
+        while True:
+            try:
+                job = claim_next_job()
+                if job:
+                    run_render_job(job)
+                    continue
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Render worker error: {e}")
+            finally:
+                db.session.remove()
+
+            _wake_event.wait(WORKER_POLL_INTERVAL)
+            _wake_event.clear()
+
+def start_render_worker(app):
+    """Start the background render worker for this process (no-op if already running)"""
+    global _worker_thread
+    with _worker_lock:
+        if _worker_thread is not None and _worker_thread.is_alive():
+            return
+        _worker_thread = threading.Thread(target=_worker_loop, args=(app,), name='render-worker', daemon=True)
+        _worker_thread.start()
@@ -0,0 +1,42 @@
+import threading
+import time
+
+# Live progress of render jobs in this process, keyed by job id
+_states = {}
+_versions = {}
+_condition = threading.Condition()
+
+# How long finished jobs stay available to late subscribers
+FINISHED_STATE_TTL = 300
+
+def publish_progress(job_id, **fields):
+    """Merge fields into a job's live progress and wake any subscribers (thread-safe)"""
+    with _condition:
+        state = _states.setdefault(job_id, {'job_id': job_id})
+        state.update(fields)
+        state['updated_at'] = time.time()
+        _versions[job_id] = _versions.get(job_id, 0) + 1
+        _prune_finished()
+        _condition.notify_all()
+
+def wait_for_progress(job_id, last_version, timeout):
+    """
+    Block until a job's progress changes or the timeout passes
+
+    Returns:
+        tuple: (state or None if unchanged or unknown, current version)
+    """
+    with _condition:
+        _condition.wait_for(lambda: _versions.get(job_id, 0) != last_version, timeout)
+        version = _versions.get(job_id, 0)
+        if version == last_version or job_id not in _states:
+            return None, version
+        return dict(_states[job_id]), version
+
+def _prune_finished():
+    """Forget finished jobs after a while (caller holds the condition)"""
+    cutoff = time.time() - FINISHED_STATE_TTL
+    for job_id in [job_id for job_id, state in _states.items()
+                   if state.get('status') in ('done', 'failed') and state['updated_at'] < cutoff]:
+        _states.pop(job_id, None)
+        _versions.pop(job_id, None)
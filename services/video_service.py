@@ -1,12 +1,31 @@
 import subprocess
 import os
+import shutil
+import json
 import logging
+from collections import Counter
 from datetime import datetime
 import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 from PIL import Image
+from services.media_probe import probe_gif_duration, probe_media_duration
+from services.disk_cache import DiskCache, file_digest, link_or_copy, make_cache_key
+from services.ffmpeg_caps import get_ffmpeg_capabilities
+from services.planner import VIDEO_DURATION_LIMITS, meme_span, plan_compilations
+from services.audio_timeline import build_audio_timeline, timeline_input
+from services.process_pool import discard_process_pool, get_pool_workers, get_process_pool
 
 def get_audio_duration(media_path):
-    """Get duration of audio or video file using FFmpeg"""
+    """Get duration of audio or video file - WAV headers are read in-process, others use FFmpeg"""
+    duration = probe_media_duration(media_path)
+    if duration is not None:
+        return duration
+
     try:
         cmd = [
             'ffprobe', '-v', 'quiet', '-show_entries', 'format=duration',
@@ -19,44 +38,419 @@ def get_audio_duration(media_path):
     except Exception:
         return 3.0  # Default fallback
 
+def parse_ffmpeg_progress(progress_fields, duration=None):
+    """Convert one block of FFmpeg -progress key=value pairs into frame, out_time and speed"""
+    try:
+        out_time = int(progress_fields.get('out_time_us', progress_fields.get('out_time_ms', 0))) / 1_000_000
+    except ValueError:
+        out_time = 0.0
+    try:
+        speed = float(progress_fields.get('speed', '0').rstrip('x'))
+    except ValueError:
+        speed = 0.0
+    try:
+        frame = int(progress_fields.get('frame', 0))
+    except ValueError:
+        frame = 0
+
+    progress = {'frame': frame, 'out_time': max(out_time, 0.0), 'speed': speed}
+    if duration:
+        progress['percent'] = min(100.0, 100.0 * progress['out_time'] / duration)
+    if progress_fields.get('progress') == 'end':
+        progress['percent'] = 100.0
+    return progress
+
+def run_ffmpeg(cmd, timeout, progress_callback=None, duration=None, input_data=None):
+    """
+    Run an FFmpeg command with machine-readable progress on stdout
+
+    progress_callback, if given, receives dicts with 'frame', 'out_time' (seconds), 'speed'
+    and, when the expected output duration is known, 'percent'. input_data, if given, is
+    written to FFmpeg's stdin (for 'pipe:0' inputs).
+
+    Returns:
+        subprocess.CompletedProcess with the collected stderr, like subprocess.run
+    """
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL
+    )
+
+    # Drain stderr on the side so a chatty FFmpeg can never block on a full pipe
+    stderr_lines = []
+    stderr_reader = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+    stderr_reader.start()
+
+    if input_data is not None:
+        def write_input():
+            try:
+                process.stdin.write(input_data)
+                process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass  # FFmpeg exited early; its return code reports why
+
+        threading.Thread(target=write_input, daemon=True).start()
+
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+    try:
+        progress_fields = {}
+        for line in process.stdout:
+            key, _, value = line.decode('utf-8', 'replace').strip().partition('=')
+            progress_fields[key] = value
+            if key == 'progress':
+                if progress_callback:
+                    try:
+                        progress_callback(parse_ffmpeg_progress(progress_fields, duration))
+                    except Exception as e:
+                        logging.warning(f"FFmpeg progress callback failed: {e}")
+                progress_fields = {}
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+        stderr_reader.join(timeout=5)
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+
+    stderr = b''.join(stderr_lines).decode('utf-8', 'replace')
+    return subprocess.CompletedProcess(cmd, returncode, stdout='', stderr=stderr)
+
+# While the source is at least this many times larger than the output, Pillow first shrinks
+# it by whole factors with a cheap box filter and only then applies LANCZOS; at 3.0 the
+# result is visually indistinguishable from a full LANCZOS resize
+RESIZE_REDUCING_GAP = 3.0
+
+def fit_size(source_width, source_height, target_width, target_height):
+    """Largest size with the source's aspect ratio that fits within the target dimensions"""
+    img_ratio = source_width / source_height
+    target_ratio = target_width / target_height
+
+    if img_ratio > target_ratio:
+        # Image is wider - fit to width
+        return target_width, int(target_width / img_ratio)
+    # Image is taller - fit to height
+    return int(target_height * img_ratio), target_height
+
+def letterbox_image(img, target_width, target_height):
+    """Resize an RGB image to fit the target dimensions and center it on a black frame"""
+    new_width, new_height = fit_size(img.width, img.height, target_width, target_height)
+
+    # Resize image
+    resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+
+    # Create new image with target dimensions and black background
+    final_img = Image.new('RGB', (target_width, target_height), (0, 0, 0))
+
+    # Paste resized image in center
+    x_offset = (target_width - new_width) // 2
+    y_offset = (target_height - new_height) // 2
+    final_img.paste(resized, (x_offset, y_offset))
+    return final_img
+
+def decode_and_letterbox(image_path, sizes):
+    """
+    Decode an image once and letterbox it to each (width, height) in sizes
+
+    JPEGs are decoded in draft mode: libjpeg scales by 1/2, 1/4 or 1/8 while decoding, down
+    to the smallest scale that still covers every requested frame, so multi-megapixel
+    sources are never decoded at full resolution.
+
+    Returns:
+        tuple: (frames, timings) - letterboxed RGB images in sizes order, and a dict with
+            source_size, decoded_size, decode_ms and resize_ms
+    """
+    decode_start = time.perf_counter()
+    with Image.open(image_path) as img:
+        source_size = img.size
+        if img.format == 'JPEG':
+            fits = [fit_size(img.width, img.height, width, height) for width, height in sizes]
+            img.draft('RGB', (max(fit[0] for fit in fits), max(fit[1] for fit in fits)))
+        img.load()
+
+        # Convert to RGB if necessary
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        resize_start = time.perf_counter()
+
+        frames = [letterbox_image(img, width, height) for width, height in sizes]
+        resize_end = time.perf_counter()
+
+        return frames, {
+            'source_size': source_size,
+            'decoded_size': img.size,
+            'decode_ms': (resize_start - decode_start) * 1000,
+            'resize_ms': (resize_end - resize_start) * 1000,
+        }
+
+def render_frame_bytes(image_path, sizes):
+    """
+    Decode an image once and return a letterboxed frame for each (width, height) as raw RGB24 bytes
+
+    Runs in image preparation worker processes, so it must not touch module state.
+
+    Returns:
+        tuple: (frames, timings) - bytes per size, and the timings from decode_and_letterbox
+    """
+    frames, timings = decode_and_letterbox(image_path, sizes)
+    return [frame.tobytes() for frame in frames], timings
+
 def prepare_image_for_video(image_path, target_width, target_height, output_path):
     """Prepare image for video by resizing and adding letterbox/pillarbox"""
     try:
-        with Image.open(image_path) as img:
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Calculate scaling to fit within target dimensions while maintaining aspect ratio
-            img_ratio = img.width / img.height
-            target_ratio = target_width / target_height
-            
-            if img_ratio > target_ratio:
-                # Image is wider - fit to width
-                new_width = target_width
-                new_height = int(target_width / img_ratio)
-            else:
-                # Image is taller - fit to height
-                new_height = target_height
-                new_width = int(target_height * img_ratio)
-            
-            # Resize image
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Create new image with target dimensions and black background
-            final_img = Image.new('RGB', (target_width, target_height), (0, 0, 0))
-            
-            # Paste resized image in center
-            x_offset = (target_width - new_width) // 2
-            y_offset = (target_height - new_height) // 2
-            final_img.paste(img, (x_offset, y_offset))
-            
-            # Save as temporary image
-            final_img.save(output_path, 'JPEG', quality=95)
-            return True
+        frames, _ = decode_and_letterbox(image_path, [(target_width, target_height)])
+        frames[0].save(output_path, 'JPEG', quality=95)
+        return True
+    except Exception as e:
+        logging.error(f"Error preparing image {image_path}: {e}")
+        return False
+
+# Version of the prepared frame format baked into every frame cache key
+FRAME_FORMAT_VERSION = 3
+
+# Frames are cached as raw RGB24 so they go to FFmpeg without an encode/decode round trip
+FRAME_SUFFIX = '.rgb'
+
+_frame_cache = None
+_frame_locks = {}
+_frame_locks_lock = threading.Lock()
+
+def get_frame_cache():
+    """Persistent cache of letterboxed meme frames (FRAME_CACHE_DIR, FRAME_CACHE_MAX_BYTES env vars)"""
+    global _frame_cache
+    if _frame_cache is None:
+        directory = os.getenv('FRAME_CACHE_DIR', os.path.join('instance', 'cache', 'frames'))
+        try:
+            max_bytes = int(os.getenv('FRAME_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+        except ValueError:
+            max_bytes = 2 * 1024 ** 3
+        _frame_cache = DiskCache(directory, max_bytes)
+    return _frame_cache
+
+def frame_cache_key(image_digest, target_width, target_height):
+    """Content-addressed key for a letterboxed frame of an image"""
+    return make_cache_key('frame', FRAME_FORMAT_VERSION, image_digest, target_width, target_height)
+
+def frame_sizes(target_width, target_height):
+    """Frame sizes prepared from one decode: the requested size and its other orientation"""
+    return list(dict.fromkeys([(target_width, target_height), (target_height, target_width)]))
+
+def store_frames(image_digest, sizes, frames):
+    """Put frames from render_frame_bytes into the frame cache"""
+    cache = get_frame_cache()
+    for (width, height), frame in zip(sizes, frames):
+        cache.put_bytes(frame_cache_key(image_digest, width, height), frame, FRAME_SUFFIX)
+
+def load_prepared_frame(image_path, target_width, target_height):
+    """
+    Get a letterboxed frame for a static image as raw RGB24 bytes, through the frame cache
+
+    A cache miss decodes the source once and stores frames for both orientations of the size, so
+    the regular and shorts variants of a meme share the decode. Concurrent callers for the
+    same image wait for the first one instead of decoding it again.
+
+    Returns:
+        bytes or None: The frame, or None if the image could not be prepared
+    """
+    cache = get_frame_cache()
+    try:
+        if not cache.enabled:
+            frames, _ = render_frame_bytes(image_path, [(target_width, target_height)])
+            return frames[0]
+
+        image_digest = file_digest(image_path)
     except Exception as e:
         logging.error(f"Error preparing image {image_path}: {e}")
+        return None
+
+    key = frame_cache_key(image_digest, target_width, target_height)
+    with _frame_locks_lock:
+        image_lock = _frame_locks.setdefault(image_digest, threading.Lock())
+
+    with image_lock:
+        cached_path = cache.get(key, FRAME_SUFFIX)
+        if cached_path:
+            try:
+                with open(cached_path, 'rb') as f:
+                    frame = f.read()
+                if len(frame) == target_width * target_height * 3:
+                    return frame
+            except OSError:
+                pass  # Evicted in the meantime; prepare it again
+
+        sizes = frame_sizes(target_width, target_height)
+        try:
+            frames, _ = render_frame_bytes(image_path, sizes)
+        except Exception as e:
+            logging.error(f"Error preparing image {image_path}: {e}")
+            return None
+        store_frames(image_digest, sizes, frames)
+        return frames[0]
+
+def prepare_frames(image_paths, target_width, target_height):
+    """
+    Prepare cached frames for many static images in a process pool ahead of encoding
+
+    Decoding and LANCZOS resizing are CPU-bound Python work, so they run in the long-lived
+    worker processes (see get_process_pool); the segment workers then only read finished
+    frames from the cache.
+
+    Returns:
+        list: Per-image timing dicts (image_path, source_size, decoded_size, decode_ms,
+            resize_ms) for the frames that had to be prepared
+    """
+    cache = get_frame_cache()
+    if not cache.enabled:
+        return []
+
+    sizes = frame_sizes(target_width, target_height)
+    pending = []
+    for image_path in dict.fromkeys(image_paths):
+        try:
+            image_digest = file_digest(image_path)
+        except OSError:
+            continue  # Reported when the segment is rendered
+        if not os.path.exists(cache.path_for(frame_cache_key(image_digest, target_width, target_height), FRAME_SUFFIX)):
+            pending.append((image_path, image_digest))
+
+    if not pending:
+        return []
+
+    # Without worker processes, segments prepare their frames themselves as they render
+    pool = get_process_pool()
+    if pool is None:
+        return []
+
+    timings = []
+    started = time.perf_counter()
+    try:
+        futures = {
+            pool.submit(render_frame_bytes, image_path, sizes): (image_path, image_digest)
+            for image_path, image_digest in pending
+        }
+        for future in as_completed(futures):
+            image_path, image_digest = futures[future]
+            try:
+                frames, image_timings = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                logging.error(f"Error preparing image {image_path}: {e}")
+                continue
+            store_frames(image_digest, sizes, frames)
+
+            image_timings['image_path'] = image_path
+            timings.append(image_timings)
+            logging.info(
+                f"Prepared frames for {image_path}: {image_timings['source_size'][0]}x{image_timings['source_size'][1]} "
+                f"decoded at {image_timings['decoded_size'][0]}x{image_timings['decoded_size'][1]} "
+                f"in {image_timings['decode_ms']:.0f}ms, resized in {image_timings['resize_ms']:.0f}ms"
+            )
+    except BrokenProcessPool as e:
+        # Segments prepare any missing frames themselves
+        logging.warning(f"Image preparation workers failed: {e}")
+        discard_process_pool(pool)
+    except Exception as e:
+        logging.warning(f"Image preparation in worker processes failed: {e}")
+
+    logging.info(f"Prepared frames for {len(timings)}/{len(pending)} images with {get_pool_workers()} processes "
+                 f"in {time.perf_counter() - started:.2f}s")
+    return timings
+
+# Repeat the single frame piped in on stdin for the whole segment
+STILL_FRAME_FILTER = 'loop=loop=-1:size=1:start=0,setsar=1'
+
+# Frames per second actually encoded for a static image; the frames keep their timestamps
+# on the output frame rate's grid, so the segment still mixes with full-rate GIF segments
+STILL_FRAME_RATE = 1
+
+# Most frames the loop filter keeps to replay a GIF on FFmpeg builds without a usable
+# -stream_loop; a shorter GIF is looped in full once its input ends
+GIF_LOOP_MAX_FRAMES = 32767
+
+# GIFs are transcoded once into a constant frame rate H.264 intermediate that FFmpeg loops
+# far more cheaply than it re-demuxes the GIF; regular keyframes keep seeking back cheap
+GIF_LOOP_PROFILE = {'short_side': None, 'preset': 'veryfast', 'crf': 18, 'fps': 30, 'audio_bitrate': None}
+
+def transcode_gif_loop(gif_path, output_path):
+    """Transcode one pass of a GIF into a loop intermediate for later renders"""
+    # The background worker and a render's fallback may both transcode the same GIF, so write
+    # to a private name and only ever expose a complete file at output_path
+    root, ext = os.path.splitext(output_path)
+    temp_path = f'{root}.{uuid.uuid4().hex[:8]}.tmp{ext}'
+    try:
+        cmd = build_ffmpeg_command(
+            [['-i', gif_path]], temp_path, GIF_LOOP_PROFILE,
+            video_filter=f"fps={GIF_LOOP_PROFILE['fps']},scale=trunc(iw/2)*2:trunc(ih/2)*2",  # x264 needs even sizes
+            audio=False,
+            output_args=['-an']
+        )
+        result = run_ffmpeg(cmd, 120)
+        if result.returncode == 0 and os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
+            os.replace(temp_path, output_path)
+            return True
+        logging.error(f"FFmpeg error transcoding GIF {gif_path}: {result.stderr}")
+        return False
+    except Exception as e:
+        logging.error(f"Error transcoding GIF {gif_path}: {e}")
         return False
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def gif_loop_source(image_path, loop_video_path=None):
+    """What to loop for a GIF: its loop intermediate when available, otherwise the GIF itself"""
+    if loop_video_path and os.path.exists(loop_video_path):
+        source_path = loop_video_path
+    else:
+        source_path = image_path
+    # Convert path separators for FFmpeg compatibility and use absolute path
+    return os.path.abspath(source_path).replace('\\', '/')
+
+def gif_input(gif_path, loop_count):
+    """Input arguments for a looped GIF (or its intermediate), with -stream_loop only where supported"""
+    if get_ffmpeg_capabilities()['stream_loop']:
+        return ['-stream_loop', str(loop_count), '-i', gif_path]
+    # gif_loop_filter does the looping instead
+    return ['-i', gif_path]
+
+def gif_loop_filter(loop_count):
+    """
+    Filters to put first on a gif_input stream: empty with -stream_loop, otherwise a loop
+    filter replaying the decoded frames so the GIF still lasts as long as its segment
+    """
+    if get_ffmpeg_capabilities()['stream_loop']:
+        return ''
+    return f'loop=loop={loop_count}:size={GIF_LOOP_MAX_FRAMES},'
+
+def raw_frame_input(width, height, fps):
+    """Input arguments for one raw RGB24 frame read from stdin"""
+    return ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-framerate', str(fps), '-i', 'pipe:0']
+
+def still_frame_filter(frame_count, fps):
+    """
+    Loop the piped frame for frame_count output frames but keep only STILL_FRAME_RATE of
+    them a second, plus the last one so the segment keeps its exact length
+    """
+    step = max(1, fps // STILL_FRAME_RATE)
+    return (f"{STILL_FRAME_FILTER},trim=end_frame={frame_count},"
+            f"select='not(mod(n\\,{step}))+eq(n\\,{frame_count - 1})'")
+
+def still_segment_command(output_path, video_width, video_height, duration, profile=None, threads=0):
+    """FFmpeg command encoding a letterboxed frame piped on stdin as a still segment"""
+    fps = get_encode_profile(profile)['fps']
+    return build_ffmpeg_command(
+        [raw_frame_input(video_width, video_height, fps)], output_path, profile,
+        video_filter=still_frame_filter(segment_frame_count(duration, fps), fps),
+        threads=threads, audio=False, still=True
+    )
 
 def is_gif(image_path):
     """Check if the image is a GIF"""
@@ -67,8 +461,14 @@ def is_gif(image_path):
 
 def get_gif_duration(gif_path):
     """Get the natural duration of a GIF animation"""
+    # Sum the frame delays in-process when Pillow can read the GIF
+    duration = probe_gif_duration(gif_path)
+    if duration is not None:
+        # GIFs often have very short durations, ensure minimum of 0.1s
+        return max(duration, 0.1)
+
     try:
-        # Use ffprobe to get the duration of the GIF
+        # Fall back to ffprobe for files Pillow can't parse
         cmd = [
             'ffprobe', '-v', 'quiet', '-show_entries', 'format=duration',
             '-of', 'csv=p=0', gif_path
@@ -84,59 +484,146 @@ def get_gif_duration(gif_path):
 
 def calculate_video_requirements(memes_data, session_data):
     """Calculate video generation requirements and progress"""
-    requirements = {
-        'regular': {
-            'min_duration': 600,  # 10 minutes
-            'max_duration': 660,  # 11 minutes
-            'current_duration': 0,
-            'available_memes': 0,
-            'can_generate': False,
-            'progress_percent': 0
-        },
-        'shorts': {
-            'min_duration': 60,   # 1 minute
-            'max_duration': 180,  # 3 minutes
-            'current_duration': 0,
-            'available_memes': 0,
-            'can_generate': False,
-            'progress_percent': 0
-        }
-    }
+    requirements = {}
 
-    # Calculate durations for available memes
-    for meme_data in memes_data:
-        # Get audio path from session
-        audio_path = session_data.get(f'audio_path_{meme_data["meme_id"]}')
+    for video_type, (min_duration, max_duration) in VIDEO_DURATION_LIMITS.items():
+        # Memes not yet used in this video type; each takes its duration plus 2 seconds of gaps
+        available = [m for m in memes_data if not m.get(f'used_in_{video_type}_video', False)]
+        current_duration = sum(meme_span(meme_data) for meme_data in available)
+        planned_videos = len(plan_compilations(available, video_type))
 
-        # Calculate duration (including 2 seconds of gaps)
-        if audio_path and os.path.exists(audio_path):
-            duration = get_audio_duration(audio_path) + 2.0  # Add gap time
-        else:
-            duration = 5.0  # 3s content + 2s gaps
-
-        # Check availability for regular videos
-        if not meme_data.get('used_in_regular_video', False):
-            requirements['regular']['current_duration'] += duration
-            requirements['regular']['available_memes'] += 1
-
-        # Check availability for shorts
-        if not meme_data.get('used_in_shorts_video', False):
-            requirements['shorts']['current_duration'] += duration
-            requirements['shorts']['available_memes'] += 1
-
-    # Calculate progress and generation capability
-    for video_type in ['regular', 'shorts']:
-        req = requirements[video_type]
-        if req['current_duration'] >= req['min_duration']:
-            req['can_generate'] = True
-            req['progress_percent'] = 100
-        else:
-            req['progress_percent'] = min(100, (req['current_duration'] / req['min_duration']) * 100)
+        requirements[video_type] = {
+            'min_duration': min_duration,
+            'max_duration': max_duration,
+            'current_duration': current_duration,
+            'available_memes': len(available),
+            'planned_videos': planned_videos,
+            # A sum over the minimum can still be impossible to split into valid videos
+            'can_generate': planned_videos > 0,
+            'progress_percent': min(100, (current_duration / min_duration) * 100)
+        }
 
     return requirements
 
-def create_video_segment(image_path, audio_path, output_path, video_width, video_height):
-    """Create a video segment from image and audio - always includes audio track for concatenation compatibility"""
+# Named encode profiles selectable per render. short_side is the output height for 16:9
+# videos and the width for 9:16 shorts; GOP length is two seconds of frames.
+ENCODE_PROFILES = {
+    'draft': {'short_side': 540, 'preset': 'ultrafast', 'crf': 28, 'fps': 30, 'audio_bitrate': '96k'},
+    'standard': {'short_side': 1080, 'preset': 'medium', 'crf': 23, 'fps': 30, 'audio_bitrate': '128k'},
+    'archival': {'short_side': 1080, 'preset': 'slow', 'crf': 18, 'fps': 30, 'audio_bitrate': '192k'},
+}
+DEFAULT_ENCODE_PROFILE = 'standard'
+
+# Low-resolution, low frame rate proxy for checking a compilation's ordering and timing
+# before committing to a full render
+PREVIEW_PROFILE = {'short_side': 360, 'preset': 'veryfast', 'crf': 30, 'fps': 10, 'audio_bitrate': '64k'}
+PREVIEW_OUTPUT_DIR = 'static/videos/previews'
+
+def get_encode_profile(profile=None):
+    """Resolve a profile name (or profile dict) to its settings, defaulting to 'standard'"""
+    if isinstance(profile, dict):
+        return profile
+    return ENCODE_PROFILES.get(profile or DEFAULT_ENCODE_PROFILE, ENCODE_PROFILES[DEFAULT_ENCODE_PROFILE])
+
+def get_video_dimensions(video_type, profile=None):
+    """Output (width, height) for a video type at a profile's resolution"""
+    short_side = get_encode_profile(profile)['short_side']
+    long_side = short_side * 16 // 9
+    if video_type == 'shorts':
+        return short_side, long_side  # 9:16 vertical
+    return long_side, short_side  # 16:9 horizontal
+
+def scale_pad_filter(video_width, video_height):
+    """Fit a picture inside the frame and letterbox/pillarbox the rest in black"""
+    return (f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,'
+            f'pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black')
+
+def audio_encode_args(profile=None, sample_rate=44100, channels=2):
+    """AAC options for an output's audio track"""
+    return [
+        '-c:a', 'aac',  # Audio codec
+        '-strict', '-2',  # Allow experimental AAC encoder
+        '-b:a', get_encode_profile(profile)['audio_bitrate'],  # Audio bitrate
+        '-ar', str(sample_rate),  # Audio sample rate
+        '-ac', str(channels),  # Audio channels (stereo by default)
+    ]
+
+def encode_args(profile=None, threads=0, audio=True, still=False, sample_rate=44100, channels=2):
+    """Codec and container options for one output of an encode profile
+
+    still encodes the sparse frames of still_frame_filter as they are timed instead of
+    resampling them to the profile's frame rate, tuned for a static picture.
+    """
+    settings = get_encode_profile(profile)
+
+    args = [
+        '-c:v', 'libx264',  # Video codec
+        '-preset', settings['preset'],  # Encoding speed/size trade-off
+        '-crf', str(settings['crf']),  # Constant rate factor
+        '-threads', str(threads),  # Encoder threads per FFmpeg process
+    ]
+    if audio:
+        args += audio_encode_args(profile, sample_rate, channels)
+    args += ['-pix_fmt', 'yuv420p']  # Pixel format for compatibility
+    if still:
+        args += [
+            '-tune', 'stillimage',  # Psychovisual settings for a static picture
+            '-fps_mode', 'passthrough',  # Keep the selected frames' timestamps
+            '-g', str(STILL_FRAME_RATE * 10),  # Few frames, so seeking stays cheap with long GOPs
+        ]
+    else:
+        args += [
+            '-r', str(settings['fps']),  # Frame rate
+            '-g', str(settings['fps'] * 2),  # GOP size for better seeking
+        ]
+    args += ['-movflags', '+faststart']  # Enable fast start for web playback
+    return args
+
+def build_ffmpeg_command(inputs, output_path, profile=None, duration=None, video_filter=None,
+                         threads=0, audio=True, output_args=None, still=False, sample_rate=44100, channels=2):
+    """
+    Build an FFmpeg encode command - every encode in this module goes through here so
+    encode profiles apply uniformly
+
+    Args:
+        inputs: List of per-input argument lists, e.g. [['-loop', '1', '-i', path], ['-i', audio_path]]
+        output_path: File to write
+        profile: Encode profile name or settings dict
+        duration: Output duration in seconds (-t), if limited
+        video_filter: Optional -vf filter chain
+        threads: Encoder threads (0 lets FFmpeg decide)
+        audio: Whether to encode an AAC audio track
+        output_args: Extra output options placed before the output path (e.g. ['-shortest'])
+        still: Encode a still image at STILL_FRAME_RATE (see encode_args)
+        sample_rate, channels: Layout of the AAC audio track
+    """
+    cmd = ['ffmpeg', '-y']  # Overwrite output file
+    for input_args in inputs:
+        cmd += input_args
+    if duration is not None:
+        cmd += ['-t', str(duration)]
+
+    cmd += encode_args(profile, threads, audio, still, sample_rate, channels)
+    if video_filter:
+        cmd += ['-vf', video_filter]
+    cmd += output_args or []
+    cmd.append(output_path)
+    return cmd
+
+def segment_frame_count(duration, fps):
+    """Whole frames a segment of this duration spans, so segment lengths add up exactly"""
+    return max(1, int(round(duration * fps)))
+
+def create_video_segment(image_path, audio_path, output_path, video_width, video_height, threads=0,
+                         duration=None, gif_duration=None, progress_callback=None, profile=None,
+                         loop_video_path=None):
+    """Create the silent video of a meme segment, lasting as long as its audio
+
+    The compilation's audio is laid out separately (see build_audio_timeline) and muxed in
+    when the segments are concatenated. Known durations (e.g. stored on the Meme) can be
+    passed in to skip probing the media files, and a GIF's loop intermediate (see
+    transcode_gif_loop) is looped instead of the GIF itself.
+    """
     try:
         logging.info(f"Creating video segment: {image_path} -> {output_path}")
 
@@ -145,221 +632,50 @@ def create_video_segment(image_path, audio_path, output_path, video_width, video
             logging.error(f"Image file not found: {image_path}")
             return False
 
-        # Handle GIFs differently to preserve animation
-        if is_gif(image_path):
-            logging.info(f"Processing GIF: {image_path}")
-            # Get audio duration or use default
+        # Get audio duration or use default
+        if duration is None:
             if audio_path and os.path.exists(audio_path):
                 duration = get_audio_duration(audio_path)
                 logging.info(f"Using audio duration: {duration}s")
-
-                # Get GIF's natural duration and calculate loops needed
-                gif_duration = get_gif_duration(image_path)
-                loops_needed = max(1, int((duration / gif_duration) + 1))  # +1 to ensure we have enough
-                logging.info(f"GIF natural duration: {gif_duration:.3f}s, loops needed: {loops_needed}")
-
-                # Build FFmpeg command with audio for GIF
-                # Convert path separators for FFmpeg compatibility and use absolute path
-                gif_path_normalized = os.path.abspath(image_path).replace('\\', '/')
-                audio_path_normalized = os.path.abspath(audio_path).replace('\\', '/')
-
-                # Use stream_loop for better GIF looping compatibility with older FFmpeg
-                # Calculate how many times we need to loop the GIF
-                loop_count = max(10, int((duration / gif_duration) * 2))
-
-                cmd = [
-                    'ffmpeg', '-y',  # Overwrite output file
-                    '-stream_loop', str(loop_count),  # Loop the input stream
-                    '-i', gif_path_normalized,  # GIF input
-                    '-i', audio_path_normalized,  # Audio input
-                    '-t', str(duration),  # Set duration to match audio
-                    '-c:v', 'libx264',  # Video codec
-                    '-preset', 'medium',  # Encoding preset for better compatibility
-                    '-crf', '23',  # Constant rate factor for good quality
-                    '-c:a', 'aac',  # Audio codec
-                    '-strict', '-2',  # Allow experimental AAC encoder
-                    '-b:a', '128k',  # Audio bitrate
-                    '-ar', '44100',  # Audio sample rate
-                    '-ac', '2',  # Audio channels (stereo)
-                    '-pix_fmt', 'yuv420p',  # Pixel format for compatibility
-                    '-r', '30',  # Frame rate
-                    '-g', '60',  # GOP size for better seeking
-                    '-movflags', '+faststart',  # Enable fast start for web playback
-                    '-vf', f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black',
-                    '-shortest',  # End when shortest stream ends
-                    output_path
-                ]
             else:
                 duration = 3.0  # Default 3 seconds for memes without audio
                 logging.info(f"No audio, using default duration: {duration}s")
 
-                # Get GIF's natural duration and calculate loops needed
-                gif_duration = get_gif_duration(image_path)
-                loops_needed = max(1, int((duration / gif_duration) + 1))  # +1 to ensure we have enough
-                logging.info(f"GIF natural duration: {gif_duration:.3f}s, loops needed: {loops_needed}")
+        fps = get_encode_profile(profile)['fps']
 
-                # Build FFmpeg command with silent audio track for GIF
-                # Convert path separators for FFmpeg compatibility and use absolute path
-                gif_path_normalized = os.path.abspath(image_path).replace('\\', '/')
+        # Handle GIFs differently to preserve animation
+        if is_gif(image_path):
+            logging.info(f"Processing GIF: {image_path}")
 
-                # Use stream_loop for better GIF looping compatibility with older FFmpeg
-                # Calculate how many times we need to loop the GIF
-                loop_count = max(10, int((duration / gif_duration) * 2))
+            # Get GIF's natural duration and calculate loops needed
+            if gif_duration is None:
+                gif_duration = get_gif_duration(image_path)
+            loops_needed = max(1, int((duration / gif_duration) + 1))  # +1 to ensure we have enough
+            logging.info(f"GIF natural duration: {gif_duration:.3f}s, loops needed: {loops_needed}")
 
-                cmd = [
-                    'ffmpeg', '-y',  # Overwrite output file
-                    '-stream_loop', str(loop_count),  # Loop the input stream
-                    '-i', gif_path_normalized,  # GIF input
-                    '-f', 'lavfi', '-i', f'anullsrc=channel_layout=stereo:sample_rate=44100',  # Silent audio
-                    '-t', str(duration),  # Set duration
-                    '-c:v', 'libx264',  # Video codec
-                    '-preset', 'medium',  # Encoding preset for better compatibility
-                    '-crf', '23',  # Constant rate factor for good quality
-                    '-c:a', 'aac',  # Audio codec
-                    '-strict', '-2',  # Allow experimental AAC encoder
-                    '-b:a', '128k',  # Audio bitrate
-                    '-ar', '44100',  # Audio sample rate
-                    '-ac', '2',  # Audio channels (stereo)
-                    '-pix_fmt', 'yuv420p',  # Pixel format for compatibility
-                    '-r', '30',  # Frame rate
-                    '-g', '60',  # GOP size for better seeking
-                    '-movflags', '+faststart',  # Enable fast start for web playback
-                    '-vf', f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black',
-                    '-shortest',  # End when shortest stream ends
-                    output_path
-                ]
+            # Calculate how many times we need to loop the GIF
+            loop_count = max(10, int((duration / gif_duration) * 2))
+            cmd = build_ffmpeg_command(
+                [gif_input(gif_loop_source(image_path, loop_video_path), loop_count)], output_path, profile,
+                video_filter=gif_loop_filter(loop_count) + scale_pad_filter(video_width, video_height),
+                threads=threads,
+                audio=False,
+                output_args=['-frames:v', str(segment_frame_count(duration, fps))]
+            )
+            frame = None
         else:
             # Handle static images (JPEG, PNG, etc.)
-            # Prepare image for video
-            temp_image = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
-            temp_image.close()
-
-            if not prepare_image_for_video(image_path, video_width, video_height, temp_image.name):
-                os.unlink(temp_image.name)
+            # Prepare image for video (shared with the meme's gaps through the frame cache)
+            frame = load_prepared_frame(image_path, video_width, video_height)
+            if frame is None:
                 return False
-
-            # Get audio duration or use default
-            if audio_path and os.path.exists(audio_path):
-                duration = get_audio_duration(audio_path)
-                logging.info(f"Using audio duration: {duration}s")
-                # Build FFmpeg command with audio
-                cmd = [
-                    'ffmpeg', '-y',  # Overwrite output file
-                    '-loop', '1', '-i', temp_image.name,  # Loop image
-                    '-i', audio_path,  # Audio input
-                    '-t', str(duration),  # Duration
-                    '-c:v', 'libx264',  # Video codec
-                    '-preset', 'medium',  # Encoding preset for better compatibility
-                    '-crf', '23',  # Constant rate factor for good quality
-                    '-c:a', 'aac',  # Audio codec
-                    '-strict', '-2',  # Allow experimental AAC encoder
-                    '-b:a', '128k',  # Audio bitrate
-                    '-ar', '44100',  # Audio sample rate
-                    '-ac', '2',  # Audio channels (stereo)
-                    '-pix_fmt', 'yuv420p',  # Pixel format for compatibility
-                    '-r', '30',  # Frame rate
-                    '-g', '60',  # GOP size for better seeking
-                    '-movflags', '+faststart',  # Enable fast start for web playback
-                    '-vf', f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black',  # Scale and pad
-                    '-shortest',  # End when shortest stream ends
-                    output_path
-                ]
-            else:
-                duration = 3.0  # Default 3 seconds for memes without audio
-                logging.info(f"No audio, using default duration: {duration}s")
-                # Build FFmpeg command with silent audio track for concatenation compatibility
-                cmd = [
-                    'ffmpeg', '-y',  # Overwrite output file
-                    '-loop', '1', '-i', temp_image.name,  # Loop image
-                    '-f', 'lavfi', '-i', f'anullsrc=channel_layout=stereo:sample_rate=44100',  # Silent audio
-                    '-t', str(duration),  # Duration
-                    '-c:v', 'libx264',  # Video codec
-                    '-preset', 'medium',  # Encoding preset for better compatibility
-                    '-crf', '23',  # Constant rate factor for good quality
-                    '-c:a', 'aac',  # Audio codec
-                    '-strict', '-2',  # Allow experimental AAC encoder
-                    '-b:a', '128k',  # Audio bitrate
-                    '-ar', '44100',  # Audio sample rate
-                    '-ac', '2',  # Audio channels (stereo)
-                    '-pix_fmt', 'yuv420p',  # Pixel format for compatibility
-                    '-r', '30',  # Frame rate
-                    '-g', '60',  # GOP size for better seeking
-                    '-movflags', '+faststart',  # Enable fast start for web playback
-                    '-vf', f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black',  # Scale and pad
-                    '-shortest',  # End when shortest stream ends
-                    output_path
-                ]
+            # Pipe the letterboxed frame in raw and encode it as a still
+            cmd = still_segment_command(output_path, video_width, video_height, duration, profile, threads)
 
         logging.info(f"Running FFmpeg command: {' '.join(cmd)}")
 
         # Run FFmpeg
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-
-        # If stream_loop failed and this is a GIF, try fallback approach
-        if result.returncode != 0 and is_gif(image_path) and '-stream_loop' in cmd:
-            logging.info("Stream loop failed, trying fallback approach for GIF")
-
-            # Try a simpler approach without stream_loop
-            gif_path_normalized = os.path.abspath(image_path).replace('\\', '/')
-
-            if audio_path and os.path.exists(audio_path):
-                # With audio
-                audio_path_normalized = os.path.abspath(audio_path).replace('\\', '/')
-                duration = get_audio_duration(audio_path)
-
-                fallback_cmd = [
-                    'ffmpeg', '-y',
-                    '-i', gif_path_normalized,
-                    '-i', audio_path_normalized,
-                    '-t', str(duration),
-                    '-c:v', 'libx264',
-                    '-preset', 'medium',
-                    '-crf', '23',
-                    '-c:a', 'aac',
-                    '-strict', '-2',
-                    '-b:a', '128k',
-                    '-ar', '44100',
-                    '-ac', '2',
-                    '-pix_fmt', 'yuv420p',
-                    '-r', '30',
-                    '-g', '60',
-                    '-movflags', '+faststart',
-                    '-vf', f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black',
-                    '-shortest',
-                    output_path
-                ]
-            else:
-                # Without audio
-                duration = 3.0
-
-                fallback_cmd = [
-                    'ffmpeg', '-y',
-                    '-i', gif_path_normalized,
-                    '-f', 'lavfi', '-i', f'anullsrc=channel_layout=stereo:sample_rate=44100',
-                    '-t', str(duration),
-                    '-c:v', 'libx264',
-                    '-preset', 'medium',
-                    '-crf', '23',
-                    '-c:a', 'aac',
-                    '-strict', '-2',
-                    '-b:a', '128k',
-                    '-ar', '44100',
-                    '-ac', '2',
-                    '-pix_fmt', 'yuv420p',
-                    '-r', '30',
-                    '-g', '60',
-                    '-movflags', '+faststart',
-                    '-vf', f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black',
-                    '-shortest',
-                    output_path
-                ]
-
-            logging.info(f"Running fallback FFmpeg command: {' '.join(fallback_cmd)}")
-            result = subprocess.run(fallback_cmd, capture_output=True, text=True, timeout=120)
-
-        # Clean up temp image if it was created
-        if not is_gif(image_path):
-            os.unlink(temp_image.name)
+        result = run_ffmpeg(cmd, 120, progress_callback, duration, input_data=frame)
 
         if result.returncode == 0:
             # Verify output file was created and has reasonable size
@@ -371,306 +687,838 @@ def create_video_segment(image_path, audio_path, output_path, video_width, video
                 return False
         else:
             logging.error(f"FFmpeg error creating segment: {result.stderr}")
-            logging.error(f"FFmpeg stdout: {result.stdout}")
             return False
 
     except Exception as e:
         logging.error(f"Error creating video segment: {e}")
         return False
 
-def create_gap_segment(duration, video_width, video_height, output_path, image_path=None):
-    """Create a gap segment - shows image if provided, otherwise black"""
+def create_gap_segment(duration, video_width, video_height, output_path, image_path=None, threads=0,
+                       gif_duration=None, progress_callback=None, profile=None, loop_video_path=None):
+    """Create a silent gap segment - shows image if provided, otherwise black"""
     try:
+        video_filter = scale_pad_filter(video_width, video_height)
+        fps = get_encode_profile(profile)['fps']
+        frame_args = ['-frames:v', str(segment_frame_count(duration, fps))]
+
         if image_path and os.path.exists(image_path):
             # Handle GIFs differently to preserve animation in gaps
             if is_gif(image_path):
                 # Create gap with animated GIF
                 # Get GIF's natural duration and calculate loops needed
-                gif_duration = get_gif_duration(image_path)
+                if gif_duration is None:
+                    gif_duration = get_gif_duration(image_path)
                 loops_needed = max(1, int((duration / gif_duration) + 1))  # +1 to ensure we have enough
                 logging.info(f"Gap GIF - natural duration: {gif_duration:.3f}s, loops needed: {loops_needed}")
 
-                # Convert path separators for FFmpeg compatibility and use absolute path
-                gif_path_normalized = os.path.abspath(image_path).replace('\\', '/')
-
                 # Calculate how many times we need to loop the GIF
                 loop_count = max(10, int((duration / gif_duration) * 2))
 
-                cmd = [
-                    'ffmpeg', '-y',
-                    '-stream_loop', str(loop_count),  # Loop the input stream
-                    '-i', gif_path_normalized,  # GIF input
-                    '-f', 'lavfi', '-i', f'anullsrc=channel_layout=stereo:sample_rate=44100',  # Silent audio
-                    '-t', str(duration),
-                    '-c:v', 'libx264',
-                    '-preset', 'medium',
-                    '-crf', '23',
-                    '-c:a', 'aac',
-                    '-strict', '-2',  # Allow experimental AAC encoder
-                    '-b:a', '128k',
-                    '-ar', '44100',
-                    '-ac', '2',
-                    '-pix_fmt', 'yuv420p',
-                    '-r', '30',
-                    '-g', '60',
-                    '-movflags', '+faststart',
-                    '-vf', f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black',
-                    '-shortest',
-                    output_path
-                ]
-
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-
-                # If stream_loop failed, try fallback approach
-                if result.returncode != 0 and '-stream_loop' in cmd:
-                    logging.info("Stream loop failed for gap GIF, trying fallback approach")
-
-                    # Try a simpler approach without stream_loop
-                    fallback_cmd = [
-                        'ffmpeg', '-y',
-                        '-i', gif_path_normalized,
-                        '-f', 'lavfi', '-i', f'anullsrc=channel_layout=stereo:sample_rate=44100',
-                        '-t', str(duration),
-                        '-c:v', 'libx264',
-                        '-preset', 'medium',
-                        '-crf', '23',
-                        '-c:a', 'aac',
-                        '-strict', '-2',
-                        '-b:a', '128k',
-                        '-ar', '44100',
-                        '-ac', '2',
-                        '-pix_fmt', 'yuv420p',
-                        '-r', '30',
-                        '-g', '60',
-                        '-movflags', '+faststart',
-                        '-vf', f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black',
-                        '-shortest',
-                        output_path
-                    ]
-
-                    result = subprocess.run(fallback_cmd, capture_output=True, text=True, timeout=30)
+                cmd = build_ffmpeg_command(
+                    [gif_input(gif_loop_source(image_path, loop_video_path), loop_count)],
+                    output_path, profile, video_filter=gif_loop_filter(loop_count) + video_filter, threads=threads,
+                    audio=False,
+                    output_args=frame_args
+                )
 
+                result = run_ffmpeg(cmd, 30, progress_callback, duration)
                 return result.returncode == 0
             else:
                 # Create gap with static image
-                temp_image = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
-                temp_image.close()
-
-                if prepare_image_for_video(image_path, video_width, video_height, temp_image.name):
-                    cmd = [
-                        'ffmpeg', '-y',
-                        '-loop', '1', '-i', temp_image.name,
-                        '-f', 'lavfi', '-i', f'anullsrc=channel_layout=stereo:sample_rate=44100',  # Silent audio
-                        '-t', str(duration),
-                        '-c:v', 'libx264',
-                        '-preset', 'medium',
-                        '-crf', '23',
-                        '-c:a', 'aac',
-                        '-strict', '-2',  # Allow experimental AAC encoder
-                        '-b:a', '128k',
-                        '-ar', '44100',
-                        '-ac', '2',
-                        '-pix_fmt', 'yuv420p',
-                        '-r', '30',
-                        '-g', '60',
-                        '-movflags', '+faststart',
-                        '-vf', f'scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2:black',
-                        '-shortest',
-                        output_path
-                    ]
-
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-                    os.unlink(temp_image.name)
+                frame = load_prepared_frame(image_path, video_width, video_height)
+
+                if frame is not None:
+                    cmd = still_segment_command(output_path, video_width, video_height, duration, profile,
+                                                threads)
+
+                    result = run_ffmpeg(cmd, 30, progress_callback, duration, input_data=frame)
                     return result.returncode == 0
-                else:
-                    os.unlink(temp_image.name)
-                    # Fall back to black if image processing fails
+                # Fall back to black if image processing fails
 
-        # Create black gap segment with audio track for concatenation compatibility
-        cmd = [
-            'ffmpeg', '-y',
-            '-f', 'lavfi', '-i', f'color=black:size={video_width}x{video_height}:duration={duration}',
-            '-f', 'lavfi', '-i', f'anullsrc=channel_layout=stereo:sample_rate=44100',  # Silent audio
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '23',
-            '-c:a', 'aac',
-            '-strict', '-2',  # Allow experimental AAC encoder
-            '-b:a', '128k',
-            '-ar', '44100',
-            '-ac', '2',
-            '-pix_fmt', 'yuv420p',
-            '-r', '30',
-            '-g', '60',
-            '-movflags', '+faststart',
-            '-shortest',
-            output_path
-        ]
+        # Create black gap segment
+        cmd = build_ffmpeg_command(
+            [['-f', 'lavfi', '-i', f'color=black:size={video_width}x{video_height}:rate={fps}']],
+            output_path, profile, threads=threads, audio=False, output_args=frame_args
+        )
 
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        result = run_ffmpeg(cmd, 30, progress_callback, duration)
         return result.returncode == 0
 
     except Exception as e:
         logging.error(f"Error creating gap segment: {e}")
         return False
 
-def concatenate_video_segments(segment_paths, output_path):
-    """Concatenate video segments into final video"""
+def probe_stream_parameters(media_path):
+    """Get the stream parameters that must match for stream-copy concatenation (None if unknown)"""
     try:
-        # Create concat file
-        concat_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
-        for segment_path in segment_paths:
-            concat_file.write(f"file '{os.path.abspath(segment_path)}'\n")
-        concat_file.close()
-        
-        # Run FFmpeg concat with re-encoding for better compatibility
         cmd = [
-            'ffmpeg', '-y',
-            '-f', 'concat', '-safe', '0', '-i', concat_file.name,
-            '-c:v', 'libx264',  # Re-encode video for consistency
-            '-preset', 'medium',
-            '-crf', '23',
-            '-c:a', 'aac',  # Re-encode audio for consistency
-            '-strict', '-2',
-            '-b:a', '128k',
-            '-ar', '44100',
-            '-ac', '2',
-            '-pix_fmt', 'yuv420p',
-            '-r', '30',
-            '-g', '60',
+            'ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', media_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        if result.returncode != 0:
+            return None
+
+        streams = json.loads(result.stdout).get('streams', [])
+        video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+        if not video:
+            return None
+
+        return (
+            video.get('codec_name'), video.get('profile'), video.get('level'),
+            video.get('width'), video.get('height'), video.get('pix_fmt'),
+            video.get('sample_aspect_ratio', '1:1'), video.get('time_base'),
+            audio.get('codec_name'), audio.get('sample_rate'), audio.get('channels')
+        )
+    except Exception:
+        return None
+
+def normalize_segment(segment_path, output_path, reference, profile=None):
+    """Re-encode a single segment so its stream parameters match the reference signature"""
+    width, height = reference[3], reference[4]
+    audio_codec, sample_rate, channels = reference[8], reference[9], reference[10]
+
+    cmd = build_ffmpeg_command(
+        [['-i', segment_path]], output_path, profile,
+        video_filter=f'{scale_pad_filter(width, height)},setsar=1',
+        audio=bool(audio_codec), sample_rate=sample_rate, channels=channels,
+        # Silent segments; the audio timeline is muxed in at concatenation
+        output_args=None if audio_codec else ['-an']
+    )
+
+    result = run_ffmpeg(cmd, 120)
+    return result.returncode == 0 and probe_stream_parameters(output_path) == reference
+
+def write_concat_file(segment_paths):
+    """Write an FFmpeg concat demuxer list and return its path"""
+    concat_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
+    for segment_path in segment_paths:
+        concat_file.write(f"file '{os.path.abspath(segment_path)}'\n")
+    concat_file.close()
+    return concat_file.name
+
+def concatenate_segments_stream_copy(segment_paths, output_path, progress_callback=None, total_duration=None,
+                                     profile=None, audio_data=None):
+    """
+    Concatenate segments without re-encoding when their parameters are compatible
+
+    Segments are probed with ffprobe; any segment that does not match the most common
+    parameter set is re-encoded on its own to match, so only the outliers pay for an encode.
+    audio_data, a PCM timeline from build_audio_timeline, is encoded as the audio track.
+    Returns False if compatibility cannot be established, so the caller can fall back.
+    """
+    normalized_paths = []
+    concat_path = None
+    try:
+        with ThreadPoolExecutor(max_workers=get_render_workers()) as executor:
+            signatures = list(executor.map(probe_stream_parameters, segment_paths))
+
+        known = [signature for signature in signatures if signature]
+        if not known:
+            return False
+        reference = Counter(known).most_common(1)[0][0]
+
+        copy_paths = []
+        for segment_path, signature in zip(segment_paths, signatures):
+            if signature == reference:
+                copy_paths.append(segment_path)
+                continue
+
+            logging.info(f"Segment {segment_path} does not match stream parameters, re-encoding it")
+            normalized_path = segment_path.rsplit('.', 1)[0] + '_normalized.mp4'
+            normalized_paths.append(normalized_path)
+            if not normalize_segment(segment_path, normalized_path, reference, profile):
+                logging.warning(f"Could not normalize segment {segment_path}")
+                return False
+            copy_paths.append(normalized_path)
+
+        concat_path = write_concat_file(copy_paths)
+        cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', concat_path]
+        if audio_data is not None:
+            # The video is copied as is; the audio timeline is the only thing encoded
+            cmd += timeline_input() + ['-map', '0:v', '-map', '1:a', '-c:v', 'copy'] + audio_encode_args(profile)
+        else:
+            cmd += ['-c', 'copy']  # Segments already share codec parameters
+        cmd += [
             '-movflags', '+faststart',  # Enable fast start for web playback
             output_path
         ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-        
+
+        result = run_ffmpeg(cmd, 300, progress_callback, total_duration, input_data=audio_data)
+        if result.returncode == 0:
+            logging.info(f"Stream-copied {len(copy_paths)} segments ({len(normalized_paths)} normalized)")
+            return True
+
+        logging.warning(f"FFmpeg stream-copy concat failed: {result.stderr}")
+        return False
+
+    except Exception as e:
+        logging.warning(f"Stream-copy concatenation unavailable: {e}")
+        return False
+    finally:
+        for path in normalized_paths + ([concat_path] if concat_path else []):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except Exception:
+                pass
+
+def concatenate_video_segments(segment_paths, output_path, progress_callback=None, total_duration=None,
+                               profile=None, audio_data=None):
+    """Concatenate video segments into final video, stream-copying when segments are compatible
+
+    progress_callback receives FFmpeg progress dicts (see run_ffmpeg); total_duration, if
+    known, lets them carry a percentage. profile sets the encoder for any re-encoding.
+    audio_data is a PCM timeline (see build_audio_timeline) muxed in as the audio track.
+    """
+    if concatenate_segments_stream_copy(segment_paths, output_path, progress_callback, total_duration, profile,
+                                        audio_data):
+        return True
+
+    logging.info("Falling back to re-encoding concatenation")
+    try:
+        # Create concat file
+        concat_path = write_concat_file(segment_paths)
+
+        # Run FFmpeg concat with re-encoding for better compatibility
+        inputs = [['-f', 'concat', '-safe', '0', '-i', concat_path]]
+        output_args = None
+        if audio_data is not None:
+            inputs.append(timeline_input())
+            output_args = ['-map', '0:v', '-map', '1:a']
+        cmd = build_ffmpeg_command(inputs, output_path, profile, output_args=output_args)
+
+        result = run_ffmpeg(cmd, 300, progress_callback, total_duration, input_data=audio_data)
+
         # Clean up concat file
-        os.unlink(concat_file.name)
-        
+        os.unlink(concat_path)
+
         if result.returncode == 0:
             return True
         else:
             logging.error(f"FFmpeg concat error: {result.stderr}")
             return False
-            
+
     except Exception as e:
         logging.error(f"Error concatenating video segments: {e}")
         return False
 
-def generate_compilation_video(memes_data, video_type='regular', target_duration=600):
+def get_filtergraph_chunk_size():
+    """Memes per FFmpeg process in the single-pass engine (FILTERGRAPH_CHUNK_MEMES env var, defaults to 8)"""
+    try:
+        chunk_size = int(os.getenv('FILTERGRAPH_CHUNK_MEMES', 8))
+    except ValueError:
+        chunk_size = 8
+    return max(1, chunk_size)
+
+def build_compilation_filtergraph(selected_memes, renditions, frame_paths, gap_duration=1.0, fps=30):
+    """
+    Build input arguments and a concat filtergraph covering the video of a run of memes
+
+    Each meme spans gap + meme + gap (the gaps show the meme image, exactly like the segment
+    engine). A static image is read as its prepared letterboxed frame and repeated with the
+    loop filter, so FFmpeg never holds the full-size source; a GIF is decoded once and split
+    between the renditions that include it, each letterboxing its own copy.
+
+    Args:
+        renditions: List of (video_width, video_height, meme_count); each rendition covers
+            the first meme_count memes and its output is labelled [vout<n>]
+        frame_paths: (meme index, rendition index) -> raw RGB24 frame file for static images
+
+    Returns:
+        tuple: (input_args, filtergraph, durations) - durations holds each rendition's length
+    """
+    input_args = []
+    filter_parts = []
+    concat_labels = [[] for _ in renditions]
+    durations = [0.0] * len(renditions)
+    gap_frames = segment_frame_count(gap_duration, fps)
+    input_index = 0
+
+    for i, meme_data in enumerate(selected_memes):
+        targets = [r for r, (_, _, meme_count) in enumerate(renditions) if i < meme_count]
+        if not targets:
+            break
+
+        # Cut to whole frames the same way as the audio timeline (see filtergraph_audio_pieces)
+        span_frames = gap_frames + segment_frame_count(meme_data.get('duration', 3.0), fps) + gap_frames
+        for r in targets:
+            durations[r] += span_frames / fps
+
+        image_path = os.path.abspath(meme_data['image_path']).replace('\\', '/')
+        if is_gif(image_path):
+            # Loop the GIF continuously across both gaps and the meme itself
+            loop_source = gif_loop_source(image_path, meme_data.get('loop_video_path'))
+            input_args += gif_input(loop_source, -1)
+            video_split = split_filter('split', f's{i}', targets)
+            filter_parts.append(
+                f'[{input_index}:v]{gif_loop_filter(-1)}fps={fps},trim=end_frame={span_frames},'
+                f'setpts=PTS-STARTPTS{video_split}'
+            )
+            input_index += 1
+            for r in targets:
+                video_width, video_height, _ = renditions[r]
+                filter_parts.append(
+                    f'[s{i}_{r}]{scale_pad_filter(video_width, video_height)},setsar=1,format=yuv420p[v{i}_{r}]'
+                )
+        else:
+            # One frame per rendition, already letterboxed to its size
+            for r in targets:
+                video_width, video_height, _ = renditions[r]
+                input_args += raw_frame_input(video_width, video_height, fps)[:-1] + [frame_paths[(i, r)]]
+                filter_parts.append(
+                    f'[{input_index}:v]{STILL_FRAME_FILTER},trim=end_frame={span_frames},'
+                    f'setpts=PTS-STARTPTS,format=yuv420p[v{i}_{r}]'
+                )
+                input_index += 1
+
+        for r in targets:
+            concat_labels[r].append(f'[v{i}_{r}]')
+
+    for r, labels in enumerate(concat_labels):
+        filter_parts.append(f"{''.join(labels)}concat=n={len(labels)}:v=1:a=0[vout{r}]")
+
+    return input_args, ';\n'.join(filter_parts), durations
+
+def split_filter(name, prefix, targets):
+    """Tail of a filter chain fanning out to one [<prefix>_<target>] label per target"""
+    labels = ''.join(f'[{prefix}_{r}]' for r in targets)
+    if len(targets) == 1:
+        return labels
+    return f',{name}={len(targets)}{labels}'
+
+def filtergraph_audio_pieces(selected_memes, fps, gap_duration=1.0):
+    """(duration, audio_path) per gap and meme, cut to the frames build_compilation_filtergraph renders"""
+    gap = segment_frame_count(gap_duration, fps) / fps
+    pieces = []
+    for meme_data in selected_memes:
+        audio_path = meme_data.get('audio_path')
+        if not (audio_path and os.path.exists(audio_path)):
+            audio_path = None
+        duration = segment_frame_count(meme_data.get('duration', 3.0), fps) / fps
+        pieces += [(gap, None), (duration, audio_path), (gap, None)]
+    return pieces
+
+def render_filtergraph_chunk(chunk_memes, renditions, output_paths, temp_dir, fps, profile=None,
+                             progress_callback=None):
+    """
+    Encode the video of a run of memes into each rendition with one FFmpeg invocation
+
+    Args:
+        renditions: List of (video_width, video_height, meme_count) as for build_compilation_filtergraph
+        output_paths: Output file per rendition that includes at least one of the memes
+
+    Returns:
+        bool: Whether every output was written
+    """
+    frame_paths = {}
+    filter_script = None
+    try:
+        for i, meme_data in enumerate(chunk_memes):
+            if is_gif(meme_data['image_path']):
+                continue
+            for r, (video_width, video_height, meme_count) in enumerate(renditions):
+                if i >= meme_count:
+                    continue
+                frame = load_prepared_frame(meme_data['image_path'], video_width, video_height)
+                if frame is None:
+                    return False
+                frame_paths[(i, r)] = os.path.join(temp_dir, f'frame_{i}_{r}{FRAME_SUFFIX}')
+                with open(frame_paths[(i, r)], 'wb') as f:
+                    f.write(frame)
+
+        input_args, filtergraph, durations = build_compilation_filtergraph(chunk_memes, renditions, frame_paths, fps=fps)
+
+        # The graph grows with the number of memes, so keep it off the command line
+        filter_script = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
+        filter_script.write(filtergraph)
+        filter_script.close()
+
+        # Encode options apply to the output that follows them, so repeat them per rendition
+        cmd = build_ffmpeg_command(
+            [input_args, ['-filter_complex_script', filter_script.name, '-map', '[vout0]']],
+            output_paths[0], profile, audio=False
+        )
+        for r, output_path in enumerate(output_paths[1:], start=1):
+            cmd += ['-map', f'[vout{r}]'] + encode_args(profile, audio=False) + [output_path]
+
+        chunk_duration = max(durations)
+        timeout = max(300, int(chunk_duration * 3 * len(output_paths)))
+        result = run_ffmpeg(cmd, timeout, progress_callback, chunk_duration)
+
+        if result.returncode == 0 and all(os.path.exists(output_path) for output_path in output_paths):
+            return True
+
+        logging.error(f"FFmpeg filtergraph render error: {result.stderr}")
+        return False
+
+    finally:
+        for path in list(frame_paths.values()) + ([filter_script.name] if filter_script else []):
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+
+def render_filtergraph_renditions(selected_memes, renditions, progress_callback=None, profile=None):
+    """
+    Render several renditions of a compilation, encoding every frame once
+
+    Memes are rendered in chunks of get_filtergraph_chunk_size(), each chunk with a single
+    FFmpeg invocation that writes every rendition, so the number of open inputs (and FFmpeg's
+    memory) stays bounded however long the compilation is. The chunks are then stream-copied
+    together and the audio timeline is encoded once, as in the segment engine.
+
+    Args:
+        renditions: List of (output_path, video_width, video_height, meme_count)
+
+    Returns:
+        bool: Whether every rendition was written
+    """
+    temp_dir = tempfile.mkdtemp()
+    try:
+        fps = get_encode_profile(profile)['fps']
+        chunk_size = get_filtergraph_chunk_size()
+        chunk_starts = list(range(0, max(meme_count for _, _, _, meme_count in renditions), chunk_size))
+        pieces = filtergraph_audio_pieces(selected_memes, fps)
+        total_duration = max(sum(duration for duration, _ in pieces[:meme_count * 3])
+                             for _, _, _, meme_count in renditions)
+        logging.info(f"Running filtergraph render with {len(selected_memes)} memes ({total_duration:.1f}s) "
+                     f"into {len(renditions)} rendition(s), {len(chunk_starts)} chunk(s) of up to {chunk_size} memes")
+
+        # Static frames for the largest rendition, and its other orientation, from one decode each
+        static_images = [meme_data['image_path'] for meme_data in selected_memes if not is_gif(meme_data['image_path'])]
+        if static_images:
+            if progress_callback:
+                progress_callback('frames', 0.0, {'frames': len(static_images)})
+            prepare_frames(static_images, renditions[0][1], renditions[0][2])
+
+        if progress_callback:
+            progress_callback('render', 0.0)
+
+        chunk_paths = [[] for _ in renditions]
+        rendered_duration = 0.0
+        for chunk_index, start in enumerate(chunk_starts):
+            chunk_memes = selected_memes[start:start + chunk_size]
+            chunk_renditions = [(video_width, video_height, meme_count - start)
+                                for _, video_width, video_height, meme_count in renditions if meme_count > start]
+            output_paths = [os.path.join(temp_dir, f'chunk_{chunk_index}_{r}.mp4') for r in range(len(chunk_renditions))]
+            chunk_duration = sum(duration for duration, _ in pieces[start * 3:(start + len(chunk_memes)) * 3])
+
+            def report_chunk(ffmpeg_progress, done=rendered_duration, length=chunk_duration):
+                if progress_callback:
+                    # Encoding the chunks is the bulk of the work; concatenation takes the last 10%
+                    fraction = (done + length * ffmpeg_progress.get('percent', 0.0) / 100) / total_duration
+                    progress_callback('render', 0.9 * fraction, ffmpeg_progress)
+
+            if not render_filtergraph_chunk(chunk_memes, chunk_renditions, output_paths, temp_dir, fps, profile,
+                                            report_chunk):
+                return False
+            for r, output_path in enumerate(output_paths):
+                chunk_paths[r].append(output_path)
+            rendered_duration += chunk_duration
+
+        if progress_callback:
+            progress_callback('concatenate', 0.9)
+
+        for r, (output_path, _, _, meme_count) in enumerate(renditions):
+            rendition_pieces = pieces[:meme_count * 3]
+            duration = sum(piece_duration for piece_duration, _ in rendition_pieces)
+
+            def report_concat(ffmpeg_progress, r=r):
+                if progress_callback:
+                    fraction = (r + ffmpeg_progress.get('percent', 0.0) / 100) / len(renditions)
+                    progress_callback('concatenate', 0.9 + 0.1 * fraction, ffmpeg_progress)
+
+            if not concatenate_video_segments(chunk_paths[r], output_path, report_concat, duration, profile,
+                                              build_audio_timeline(rendition_pieces)):
+                return False
+        return True
+
+    except Exception as e:
+        logging.error(f"Error rendering filtergraph video: {e}")
+        return False
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def render_filtergraph_video(selected_memes, output_path, video_width, video_height, progress_callback=None,
+                             profile=None):
+    """Render the compilation through filtergraphs over chunks of memes so every frame is encoded once"""
+    return render_filtergraph_renditions(
+        selected_memes, [(output_path, video_width, video_height, len(selected_memes))],
+        progress_callback=progress_callback, profile=profile
+    )
+
+def get_render_workers():
+    """Number of segments rendered concurrently (RENDER_WORKERS env var, defaults to CPU count)"""
+    cpu_count = os.cpu_count() or 1
+    try:
+        workers = int(os.getenv('RENDER_WORKERS', cpu_count))
+    except ValueError:
+        workers = cpu_count
+    return max(1, workers)
+
+def get_ffmpeg_threads(workers):
+    """Split the machine's cores between concurrently running FFmpeg processes"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+# Version of the segment commands baked into every cache key; bump it when build_ffmpeg_command
+# or the segment filters change in a way the encode profile settings don't capture
+SEGMENT_FORMAT_VERSION = 5
+
+_segment_cache = None
+
+def get_segment_cache():
+    """Persistent cache of rendered segments (SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES env vars)"""
+    global _segment_cache
+    if _segment_cache is None:
+        directory = os.getenv('SEGMENT_CACHE_DIR', os.path.join('instance', 'cache', 'segments'))
+        try:
+            max_bytes = int(os.getenv('SEGMENT_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+        except ValueError:
+            max_bytes = 2 * 1024 ** 3
+        _segment_cache = DiskCache(directory, max_bytes)
+    return _segment_cache
+
+def segment_cache_key(kind, image_path, audio_path, duration, video_width, video_height, profile=None):
+    """Content-addressed key for a rendered segment"""
+    audio_digest = file_digest(audio_path) if audio_path and os.path.exists(audio_path) else None
+    return make_cache_key(
+        'segment', SEGMENT_FORMAT_VERSION, kind, file_digest(image_path), audio_digest, duration,
+        video_width, video_height, sorted(get_encode_profile(profile).items())
+    )
+
+def render_cached_segment(key_parts, output_path, function, args, threads=0, progress_callback=None, profile=None):
+    """Reuse a previously rendered segment when available, otherwise render and cache it"""
+    cache = get_segment_cache()
+    key = segment_cache_key(*key_parts, profile=profile) if cache.enabled else None
+
+    cached_path = cache.get(key, '.mp4') if key else None
+    if cached_path:
+        link_or_copy(cached_path, output_path)
+        logging.info(f"Reused cached segment for {output_path}")
+        return True
+
+    if not function(*args, threads=threads, progress_callback=progress_callback, profile=profile):
+        return False
+
+    if key:
+        cache.put(key, output_path, '.mp4')
+    return True
+
+def meme_segment_jobs(meme_data, temp_dir, index, video_width, video_height, profile=None):
+    """
+    The gap before, meme and gap after segments of one meme, as render_segmented_video jobs
+
+    Returns:
+        list: (output_path, required, function, args, cache key parts, (duration, audio_path))
+            per segment in playback order
+    """
+    # Segments are silent and cut to whole frames; the audio timeline uses the same lengths
+    fps = get_encode_profile(profile)['fps']
+    gap_duration = segment_frame_count(1.0, fps) / fps
+
+    image_path = meme_data['image_path']
+    audio_path = meme_data.get('audio_path')
+    if not (audio_path and os.path.exists(audio_path)):
+        audio_path = None
+    gap_before_path = os.path.join(temp_dir, f'gap_before_{index}.mp4')
+    meme_segment_path = os.path.join(temp_dir, f'meme_{index}.mp4')
+    gap_after_path = os.path.join(temp_dir, f'gap_after_{index}.mp4')
+
+    duration = meme_data.get('duration')
+    if duration is None:
+        duration = get_audio_duration(audio_path) if audio_path else 3.0
+    duration = segment_frame_count(duration, fps) / fps
+
+    # Both gaps of a meme are identical, so they share one cache entry; GIFs are keyed by
+    # what actually gets looped. Segments carry no audio, so only its length matters.
+    loop_video_path = meme_data.get('loop_video_path')
+    source_path = gif_loop_source(image_path, loop_video_path) if is_gif(image_path) else image_path
+    gap_key = ('gap', source_path, None, gap_duration, video_width, video_height)
+    meme_key = ('meme', source_path, None, duration, video_width, video_height)
+
+    # Pass the stored durations and GIF intermediates along so segments don't probe or
+    # demux the GIF again
+    gap_function = partial(create_gap_segment, gif_duration=meme_data.get('gif_duration'),
+                           loop_video_path=loop_video_path)
+    meme_function = partial(create_video_segment, duration=duration,
+                            gif_duration=meme_data.get('gif_duration'), loop_video_path=loop_video_path)
+
+    return [
+        (gap_before_path, False, gap_function,
+         (gap_duration, video_width, video_height, gap_before_path, image_path), gap_key, (gap_duration, None)),
+        (meme_segment_path, True, meme_function,
+         (image_path, audio_path, meme_segment_path, video_width, video_height), meme_key, (duration, audio_path)),
+        (gap_after_path, False, gap_function,
+         (gap_duration, video_width, video_height, gap_after_path, image_path), gap_key, (gap_duration, None)),
+    ]
+
+def render_segmented_video(selected_memes, output_path, video_width, video_height, progress_callback=None,
+                           profile=None):
+    """Render each gap and meme as its own segment on a worker pool, then concatenate them"""
+    # Create temporary directory for segments
+    temp_dir = tempfile.mkdtemp()
+
+    # Segment jobs in playback order: (output_path, required, function, args, cache key parts,
+    # (duration, audio_path) of its stretch of the audio timeline)
+    # A failed gap is skipped like before; a failed meme segment is a hard failure
+    segment_jobs = []
+    for i, meme_data in enumerate(selected_memes):
+        segment_jobs += meme_segment_jobs(meme_data, temp_dir, i, video_width, video_height, profile)
+
+    try:
+        # Decode and resize static images in a process pool before the FFmpeg workers need
+        # them, skipping images whose segments are all cached already
+        segment_cache = get_segment_cache()
+        frame_images = [
+            meme_data['image_path'] for meme_data, (_, _, _, _, gap_key, _), (_, _, _, _, meme_key, _)
+            in zip(selected_memes, segment_jobs[0::3], segment_jobs[1::3])
+            if not is_gif(meme_data['image_path']) and not (segment_cache.enabled and all(
+                os.path.exists(segment_cache.path_for(segment_cache_key(*key_parts, profile=profile), '.mp4'))
+                for key_parts in (gap_key, meme_key)
+            ))
+        ]
+        if frame_images:
+            if progress_callback:
+                progress_callback('frames', 0.0, {'frames': len(frame_images)})
+            prepare_frames(frame_images, video_width, video_height)
+
+        workers = min(get_render_workers(), len(segment_jobs)) or 1
+        threads = get_ffmpeg_threads(workers)
+        logging.info(f"Rendering {len(segment_jobs)} segments with {workers} workers, {threads} FFmpeg threads each")
+
+        # Each job spends its time in an FFmpeg subprocess, so threads are enough to keep the pool busy
+        results = [False] * len(segment_jobs)
+
+        # Per-segment completion, updated from FFmpeg progress on the worker threads
+        segment_fractions = [0.0] * len(segment_jobs)
+        progress_lock = threading.Lock()
+
+        def report_segment(index, ffmpeg_progress):
+            with progress_lock:
+                if ffmpeg_progress is None:
+                    segment_fractions[index] = 1.0
+                else:
+                    segment_fractions[index] = ffmpeg_progress.get('percent', 0.0) / 100
+                # Segment encoding is the bulk of the work; concatenation takes the last 10%
+                fraction = 0.9 * sum(segment_fractions) / len(segment_jobs)
+            if progress_callback:
+                detail = {'segment': index + 1, 'segments': len(segment_jobs)}
+                detail.update(ffmpeg_progress or {})
+                progress_callback('segments', fraction, detail)
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                executor.submit(render_cached_segment, key_parts, path, function, args, threads,
+                                partial(report_segment, index), profile): index
+                for index, (path, _, function, args, key_parts, _) in enumerate(segment_jobs)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logging.error(f"Segment worker raised an error: {e}")
+                    results[index] = False
+
+                if not results[index] and segment_jobs[index][1]:
+                    logging.error(f"Failed to render required segment {segment_jobs[index][0]}, stopping render pool")
+                    return False
+
+                report_segment(index, None)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        # Keep playback order regardless of completion order
+        rendered_jobs = [job for job, ok in zip(segment_jobs, results) if ok]
+        segment_paths = [job[0] for job in rendered_jobs]
+
+        if progress_callback:
+            progress_callback('concatenate', 0.9)
+
+        # The whole soundtrack is laid out once and encoded once while concatenating
+        audio_pieces = [job[5] for job in rendered_jobs]
+        audio_data = build_audio_timeline(audio_pieces)
+
+        def report_concat(ffmpeg_progress):
+            if progress_callback:
+                progress_callback('concatenate', 0.9 + 0.1 * ffmpeg_progress.get('percent', 0.0) / 100, ffmpeg_progress)
+
+        # Concatenate all segments
+        total_duration = sum(duration for duration, _ in audio_pieces)
+        return bool(segment_paths) and concatenate_video_segments(
+            segment_paths, output_path, report_concat, total_duration, profile, audio_data
+        )
+
+    finally:
+        # Clean up temporary files
+        for segment_path, _, _, _, _, _ in segment_jobs:
+            try:
+                if os.path.exists(segment_path):
+                    os.remove(segment_path)
+            except Exception:
+                pass
+        try:
+            os.rmdir(temp_dir)
+        except Exception:
+            pass
+
+# Available render engines for generate_compilation_video
+RENDER_ENGINES = {
+    'segments': render_segmented_video,
+    'filtergraph': render_filtergraph_video,
+}
+
+def compilation_output_path(video_type, output_dir):
+    """New output file for a compilation; the suffix keeps compilations rendered in the same second apart"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    suffix = uuid.uuid4().hex[:6]
+    if video_type == 'shorts':
+        output_filename = f'shorts_compilation_{timestamp}_{suffix}.mp4'
+    else:
+        output_filename = f'video_compilation_{timestamp}_{suffix}.mp4'
+    return os.path.join(output_dir, output_filename)
+
+def generate_compilation_video(memes_data, video_type='regular', target_duration=600, engine='segments',
+                               progress_callback=None, profile=None, preselected=False,
+                               output_dir='static/videos'):
     """
     Generate compilation video from memes data
-    
+
     Args:
         memes_data: List of dicts with 'image_path', 'audio_path', 'duration' keys
+                    (and optionally 'gif_duration')
         video_type: 'regular' (16:9) or 'shorts' (9:16)
         target_duration: Target duration in seconds
-    
+        engine: 'segments' (per-segment encode + concat) or 'filtergraph' (single pass)
+        profile: Encode profile name from ENCODE_PROFILES (resolution, preset, quality),
+            or a settings dict such as PREVIEW_PROFILE
+        preselected: Render memes_data exactly as given instead of selecting memes to fit the
+            duration limits (e.g. to promote a preview with the same selection)
+        output_dir: Directory the compilation is written to
+        progress_callback: Optional callable(stage, fraction, detail=None) called as the render
+            advances, possibly from worker threads; detail carries segment index and FFmpeg
+            frame/out_time/speed when known
+
     Returns:
         tuple: (success, output_path, actual_duration, memes_used, used_meme_ids)
     """
     try:
         # Video dimensions and duration requirements
-        if video_type == 'shorts':
-            video_width, video_height = 1080, 1920  # 9:16 vertical
-            min_duration = 60   # 1 minute minimum
-            max_duration = 180  # 3 minutes max
-        else:
-            video_width, video_height = 1920, 1080  # 16:9 horizontal
-            min_duration = 600  # 10 minutes minimum
-            max_duration = 660  # 11 minutes max
-        
+        video_width, video_height = get_video_dimensions(video_type, profile)
+        min_duration, max_duration = VIDEO_DURATION_LIMITS[video_type]
+
         # Calculate which memes to include
         selected_memes = []
         used_meme_ids = []
         total_duration = 0
 
-        for meme_data in memes_data:
-            # Each meme segment: 1s gap + meme duration + 1s gap
-            meme_duration = meme_data.get('duration', 3.0)
-            segment_duration = 1.0 + meme_duration + 1.0
+        if preselected:
+            # Keep the given selection and order, e.g. when promoting a preview
+            selected_memes = list(memes_data)
+            used_meme_ids = [meme_data.get('meme_id') for meme_data in selected_memes]
+            total_duration = sum(meme_span(meme_data) for meme_data in selected_memes)
+        else:
+            for meme_data in memes_data:
+                # Each meme segment: 1s gap + meme duration + 1s gap
+                segment_duration = meme_span(meme_data)
 
-            # Check if adding this meme would exceed limits
-            if total_duration + segment_duration > max_duration:
-                break
+                # Check if adding this meme would exceed limits
+                if total_duration + segment_duration > max_duration:
+                    break
 
-            selected_memes.append(meme_data)
-            used_meme_ids.append(meme_data.get('meme_id'))
-            total_duration += segment_duration
+                selected_memes.append(meme_data)
+                used_meme_ids.append(meme_data.get('meme_id'))
+                total_duration += segment_duration
 
-            # For regular videos, stop if we have enough content
-            if video_type == 'regular' and total_duration >= target_duration:
-                break
+                # For regular videos, stop if we have enough content
+                if video_type == 'regular' and total_duration >= target_duration:
+                    break
 
         # Check if we have enough content for regular videos
-        if video_type == 'regular' and total_duration < target_duration:
+        if not preselected and video_type == 'regular' and total_duration < target_duration:
             return False, None, 0, 0, []
 
         if not selected_memes:
             return False, None, 0, 0, []
         
         # Create output directory
-        output_dir = 'static/videos'
         os.makedirs(output_dir, exist_ok=True)
         
-        # Generate output filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        if video_type == 'shorts':
-            output_filename = f'shorts_compilation_{timestamp}.mp4'
+        output_path = compilation_output_path(video_type, output_dir)
+
+        render = RENDER_ENGINES.get(engine)
+        if render is None:
+            logging.error(f"Unknown render engine: {engine}")
+            return False, None, 0, 0, []
+
+        settings = get_encode_profile(profile)
+        logging.info(f"Rendering {video_type} compilation with '{engine}' engine at {video_width}x{video_height}, "
+                     f"{settings['fps']}fps, preset {settings['preset']}, CRF {settings['crf']}")
+
+        if render(selected_memes, output_path, video_width, video_height, progress_callback=progress_callback,
+                  profile=profile):
+            # Measure the actual duration of the final video
+            actual_duration = get_audio_duration(output_path)  # This works for video files too
+            logging.info(f"Video generation completed. Planned duration: {total_duration:.3f}s, Actual duration: {actual_duration:.3f}s")
+            if progress_callback:
+                progress_callback('done', 1.0)
+            return True, output_path, actual_duration, len(selected_memes), used_meme_ids
         else:
-            output_filename = f'video_compilation_{timestamp}.mp4'
-        
-        output_path = os.path.join(output_dir, output_filename)
-        
-        # Create temporary directory for segments
-        temp_dir = tempfile.mkdtemp()
-        segment_paths = []
-        
-        try:
-            for i, meme_data in enumerate(selected_memes):
-                # Create gap before meme (showing the meme image)
-                gap_before_path = os.path.join(temp_dir, f'gap_before_{i}.mp4')
-                if create_gap_segment(1.0, video_width, video_height, gap_before_path, meme_data['image_path']):
-                    segment_paths.append(gap_before_path)
-
-                # Create meme segment
-                meme_segment_path = os.path.join(temp_dir, f'meme_{i}.mp4')
-                if create_video_segment(
-                    meme_data['image_path'],
-                    meme_data.get('audio_path'),
-                    meme_segment_path,
-                    video_width,
-                    video_height
-                ):
-                    segment_paths.append(meme_segment_path)
-
-                # Create gap after meme (showing the meme image)
-                gap_after_path = os.path.join(temp_dir, f'gap_after_{i}.mp4')
-                if create_gap_segment(1.0, video_width, video_height, gap_after_path, meme_data['image_path']):
-                    segment_paths.append(gap_after_path)
-            
-            # Concatenate all segments
-            if segment_paths and concatenate_video_segments(segment_paths, output_path):
-                # Measure the actual duration of the final video
-                actual_duration = get_audio_duration(output_path)  # This works for video files too
-                logging.info(f"Video generation completed. Planned duration: {total_duration:.3f}s, Actual duration: {actual_duration:.3f}s")
-                return True, output_path, actual_duration, len(selected_memes), used_meme_ids
-            else:
-                return False, None, 0, 0, []
-                
-        finally:
-            # Clean up temporary files
-            for segment_path in segment_paths:
-                try:
-                    if os.path.exists(segment_path):
-                        os.remove(segment_path)
-                except Exception:
-                    pass
-            try:
-                os.rmdir(temp_dir)
-            except Exception:
-                pass
-        
+            return False, None, 0, 0, []
+
     except Exception as e:
         logging.error(f"Error generating compilation video: {e}")
         return False, None, 0, 0, []
+
+def generate_dual_compilation(memes_data, shorts_count, progress_callback=None, profile=None,
+                              output_dir='static/videos'):
+    """
+    Render a regular video and a short of its first memes from one decode of the media
+
+    Each chunk of memes is encoded into both renditions by one FFmpeg process (see
+    render_filtergraph_renditions), so every image and GIF is decoded once instead of once
+    per video type.
+
+    Args:
+        memes_data: Memes of the regular video, in order
+        shorts_count: Number of leading memes that also make up the short
+        profile: Encode profile name or settings dict, shared by both renditions
+        output_dir: Directory both videos are written to
+        progress_callback: Optional callable(stage, fraction, detail=None)
+
+    Returns:
+        list: (video_type, result) for 'regular' and 'shorts', where result is a
+            generate_compilation_video return tuple
+    """
+    failed = (False, None, 0, 0, [])
+    selections = {'regular': list(memes_data), 'shorts': list(memes_data[:shorts_count])}
+
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+
+        output_paths = {video_type: compilation_output_path(video_type, output_dir) for video_type in selections}
+        renditions = [
+            (output_paths[video_type], *get_video_dimensions(video_type, profile), len(selected))
+            for video_type, selected in selections.items()
+        ]
+        logging.info(f"Rendering regular and shorts compilations in one pass: {len(memes_data)} memes, "
+                     f"the first {shorts_count} in the short")
+
+        if not render_filtergraph_renditions(memes_data, renditions, progress_callback=progress_callback,
+                                             profile=profile):
+            return [(video_type, failed) for video_type in selections]
+
+        results = []
+        for video_type, selected in selections.items():
+            actual_duration = get_audio_duration(output_paths[video_type])
+            results.append((video_type, (True, output_paths[video_type], actual_duration, len(selected),
+                                         [meme_data.get('meme_id') for meme_data in selected])))
+        if progress_callback:
+            progress_callback('done', 1.0)
+        return results
+
+    except Exception as e:
+        logging.error(f"Error generating dual compilation: {e}")
+        return [(video_type, failed) for video_type in selections]
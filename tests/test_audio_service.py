@@ -0,0 +1,55 @@
+import os
+import wave
+
+import pytest
+
+from services import audio_service
+
+
+class LastFileOnlyEngine:
+    """Stand-in for pyttsx3 2.99's espeak driver: one runAndWait() only writes the last queued file"""
+
+    def __init__(self):
+        self.queued = []
+        self.runs = 0
+
+    def save_to_file(self, text, filename, name=None):
+        self.queued.append(filename)
+
+    def runAndWait(self):
+        self.runs += 1
+        if self.queued:
+            with wave.open(self.queued[-1], 'wb') as f:
+                f.setnchannels(1)
+                f.setsampwidth(2)
+                f.setframerate(22050)
+                f.writeframes(b'\x00\x01' * 22050)
+        self.queued = []
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setenv('TTS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(audio_service, '_tts_cache', None)
+    manager = audio_service.TTSEngineManager()
+    manager._engine = LastFileOnlyEngine()
+    monkeypatch.setattr(audio_service, '_engine_manager', manager)
+    return manager._engine
+
+
+def test_batch_writes_every_file(engine, tmp_path):
+    items = [(f'caption {i}', str(tmp_path / 'audio' / f'audio_{i}.wav')) for i in range(4)]
+
+    assert audio_service.generate_audio_batch(items) == [True] * 4
+    for _, output_path in items:
+        assert os.path.getsize(output_path) > 1000
+        assert os.path.exists(audio_service.audio_preview_path(output_path))
+
+
+def test_single_job_is_not_rendered_twice(engine, tmp_path):
+    output_path = str(tmp_path / 'audio_0.wav')
+
+    assert audio_service.get_tts_engine().synthesize_batch([('caption', output_path)]) == [
+        {'ok': True, 'seconds': None}
+    ]
+    assert engine.runs == 1